@@ -1,35 +1,108 @@
 """Web3 Carbon Footprint Offsetting Integration."""
 
+from __future__ import annotations
+
 import asyncio
 import logging
-from datetime import date
+from datetime import date, timedelta
+from time import monotonic
 
+import homeassistant.helpers.config_validation as cv
+import homeassistant.util.dt as dt_util
+import voluptuous as vol
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, ServiceCall, ServiceResponse, SupportsResponse
 from homeassistant.helpers.typing import ConfigType
-from robonomicsinterface import Account, Liability, web_3_auth
+from robonomicsinterface import Account, Liability
 from substrateinterface import KeypairType
 
 from .client import Client
 from .const import (
+    AGENT_NODE_MULTIADDR,
+    ATTR_ADDRESS,
+    ATTR_END,
+    ATTR_FILE,
+    ATTR_GROUP_BY,
+    ATTR_KIND,
+    ATTR_SPEED,
+    ATTR_START,
+    CLIENT_ID,
     CONF_ADMIN_SEED,
+    CONF_AGENT_MULTIADDR,
+    CONF_AUTO_INTERVAL,
+    CONF_AUTO_THRESHOLD,
+    CONF_BATCH_LINGER,
+    CONF_BATCH_SIZE,
+    CONF_CARBON_INTENSITY,
+    CONF_CLIENT_ID,
+    CONF_COMPRESS_TECHNICS,
+    CONF_EARLY_RETRY,
     CONF_ENERGY_CONSUMPTION_ENTITIES,
     CONF_ENERGY_PRODUCTION_ENTITIES,
-    CONF_IPFS_GATEWAY_AUTH,
-    CONF_IPFS_GATEWAY_PWD,
-    CONF_IPFS_GW,
-    CONF_IS_W3GW,
+    CONF_MAX_JITTER,
+    CONF_MIN_BATCH,
+    CONF_QUEUE_OVERFLOW_POLICY,
+    CONF_QUEUE_SIZE,
+    CONF_RECORD_TRAFFIC,
+    CONF_TECHNICS_DETAIL,
+    CONF_TIMEOUT_CEILING,
+    CONF_TIMEOUT_FLOOR,
+    CONF_TIMEOUT_MULTIPLIER,
+    CONF_TIMEOUT_PERCENTILE,
+    DEFAULT_BATCH_LINGER,
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_CARBON_INTENSITY,
+    DEFAULT_LIABILITY_TIMEOUT,
+    DEFAULT_MAX_JITTER,
+    DEFAULT_QUERY_TIMEOUT,
+    DEFAULT_QUEUE_SIZE,
+    DEFAULT_TIMEOUT_CEILING,
+    DEFAULT_TIMEOUT_FLOOR,
+    DEFAULT_TIMEOUT_MULTIPLIER,
+    DEFAULT_TIMEOUT_PERCENTILE,
     DOMAIN,
-    IPFS_GW,
     LAST_COMPENSATION_DATE_RESPONSE_TOPIC,
+    LEDGER_FILE,
     LIABILITY_REPORT_TOPIC,
+    OVERFLOW_DROP_FOREIGN_FIRST,
     PLATFORMS,
+    RECORDING_FILE,
+    TECHNICS_DETAIL_SUMMARY,
 )
+from .scheduler import AutoCompensationScheduler
+from .utils.batching import BatchPublisher
+from .utils.dispatcher import ResponseDispatcher
+from .utils.emissions import EmissionsEngine, async_remove_emissions, emissions_storage_key, parse_intensity_profile
+from .utils.ipfs import get_ipfs_gateways
+from .utils.ledger import GROUP_BY_FORMATS, KIND_LIABILITY, KIND_QUERY, KIND_REPORT, CompensationLedger
 from .utils.offsetting_client import send_last_compensation_date_query, send_offset_query
-from .utils.pubsub import parse_income_message, subscribe_response_topic_wrapper
+from .utils.pubsub import AddressFilter, PubSubTransport
+from .utils.recording import TrafficRecorder, replay_recording
+from .utils.resources import ResourceRegistry
+from .utils.rtt import RttTracker
 
 _LOGGER = logging.getLogger(__name__)
 
+COMPENSATION_HISTORY_SCHEMA = vol.Schema(
+    {
+        vol.Optional(ATTR_ADDRESS): cv.string,
+        vol.Optional(ATTR_START): cv.date,
+        vol.Optional(ATTR_END): cv.date,
+        vol.Optional(ATTR_KIND): vol.In([KIND_QUERY, KIND_LIABILITY, KIND_REPORT]),
+        vol.Optional(ATTR_GROUP_BY): vol.In(list(GROUP_BY_FORMATS)),
+    }
+)
+
+REPLAY_TRAFFIC_SCHEMA = vol.Schema(
+    {
+        # A bare file name, resolved in the configuration directory only.
+        vol.Optional(ATTR_FILE, default=RECORDING_FILE): vol.All(
+            cv.string, vol.Match(r"^[^/\\]+$", msg="expected a file name"), vol.NotIn([".", ".."])
+        ),
+        vol.Optional(ATTR_SPEED, default=1.0): vol.All(vol.Coerce(float), vol.Range(min=0)),
+    }
+)
+
 
 async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
     """
@@ -58,136 +131,128 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     _LOGGER.debug("Starting setup in init")
     conf = entry.data
     _LOGGER.debug("Executing hass.data.setdefault")
-    hass.data.setdefault(DOMAIN, {})[entry.entry_id] = Client(hass)
-    hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
+    hass.data.setdefault(DOMAIN, {})
+    if "dispatcher" not in hass.data[DOMAIN]:
+        await async_setup_shared(hass, conf)
+    if conf.get(CONF_AGENT_MULTIADDR, AGENT_NODE_MULTIADDR) != hass.data[DOMAIN]["transport"].agent_multiaddr:
+        _LOGGER.info(
+            f"{entry.title} probed agent node {conf.get(CONF_AGENT_MULTIADDR)}, but the PubSub connection shared by "
+            f"all the households uses {hass.data[DOMAIN]['transport'].agent_multiaddr}"
+        )
 
-    hass.data[DOMAIN]["energy_consumption_entities"] = conf[CONF_ENERGY_CONSUMPTION_ENTITIES]
-    _LOGGER.debug(f"Set energy consumption entities to: {hass.data[DOMAIN]['energy_consumption_entities']}")
-    hass.data[DOMAIN]["energy_production_entities"] = conf[CONF_ENERGY_PRODUCTION_ENTITIES]
-    _LOGGER.debug(f"Set energy production entities to: {hass.data[DOMAIN]['energy_production_entities']}")
+    account = Account(seed=conf[CONF_ADMIN_SEED], crypto_type=KeypairType.ED25519)
+    account_addr = account.get_address()
+    if entry.unique_id == DOMAIN:
+        # Entries created before multi-household support had a fixed unique ID, keep their entities IDs.
+        hass.config_entries.async_update_entry(entry, unique_id=account_addr, data={**conf, CONF_CLIENT_ID: CLIENT_ID})
+        conf = entry.data
+
+    entry_data = hass.data[DOMAIN][entry.entry_id] = dict(
+        client=Client(hass, conf.get(CONF_CLIENT_ID, f"{CLIENT_ID}_{account_addr}"), entry.title),
+        account_addr=account_addr,
+        liability=Liability(account=account),
+        resources=ResourceRegistry(f"Entry {entry.title}"),
+    )
+    _LOGGER.debug(f"Set account address to {account_addr}")
+    resources = entry_data["resources"]
+
+    entry_data["energy_consumption_entities"] = conf[CONF_ENERGY_CONSUMPTION_ENTITIES]
+    _LOGGER.debug(f"Set energy consumption entities to: {entry_data['energy_consumption_entities']}")
+    entry_data["energy_production_entities"] = conf[CONF_ENERGY_PRODUCTION_ENTITIES]
+    _LOGGER.debug(f"Set energy production entities to: {entry_data['energy_production_entities']}")
+    entry_data["emissions"] = EmissionsEngine(
+        hass,
+        entry_data["energy_consumption_entities"],
+        entry_data["energy_production_entities"],
+        parse_intensity_profile(conf.get(CONF_CARBON_INTENSITY, DEFAULT_CARBON_INTENSITY)),
+        emissions_storage_key(account_addr),
+    )
 
     geo = hass.states.get("zone.home")
     geo_str = f'{geo.attributes["latitude"]}, {geo.attributes["longitude"]}'
     _LOGGER.debug(f"Set geo to {geo_str}")
 
-    if CONF_IPFS_GW in conf:
-        hass.data[DOMAIN]["ipfs_gw"] = conf[CONF_IPFS_GW]
-    else:
-        hass.data[DOMAIN]["ipfs_gw"] = IPFS_GW
-    _LOGGER.debug(f"Set ipfs_gw to {hass.data[DOMAIN]['ipfs_gw']}")
-
-    if CONF_IS_W3GW in conf:
-
-        def ipfs_w3gw_auth_wrapper():
-            """
-            Gateway wrapper to get fresh web3_auth header.
+    entry_data["ipfs_gateways"] = get_ipfs_gateways(conf)
 
-            :return: web3_auth header.
-            """
-            return web_3_auth(conf[CONF_ADMIN_SEED])
-
-        hass.data[DOMAIN]["ipfs_gw_auth"] = ipfs_w3gw_auth_wrapper
-        _LOGGER.debug(f"Set ipfs_gw_auth to web3-auth format")
-
-    elif CONF_IPFS_GATEWAY_AUTH in conf:
-
-        def ipfs_auth_wrapper():
-            """
-            Gateway wrapper to get auth header.
-
-            :return: Auth header.
-            """
-            return conf[CONF_IPFS_GATEWAY_AUTH], conf[CONF_IPFS_GATEWAY_PWD]
-
-        hass.data[DOMAIN]["ipfs_gw_auth"] = ipfs_auth_wrapper
-        _LOGGER.debug(f"Set ipfs_gw_auth to login/password")
-    else:
-
-        def ipfs_empty_auth_wrapper():
-            """
-            Gateway wrapper to get empty auth header.
-
-            :return: Empty header.
-            """
-            return ()
-
-        hass.data[DOMAIN]["ipfs_gw_auth"] = ipfs_empty_auth_wrapper
-        _LOGGER.debug(f"Set ipfs_gw_auth to empty")
-
-    account = Account(seed=conf[CONF_ADMIN_SEED], crypto_type=KeypairType.ED25519)
-    hass.data[DOMAIN]["account_addr"] = account.get_address()
-    hass.data[DOMAIN]["liability"] = Liability(account=account)
+    client = entry_data["client"]
+    dispatcher = hass.data[DOMAIN]["dispatcher"]
+    publisher = hass.data[DOMAIN]["publisher"]
+    rtt_tracker = hass.data[DOMAIN]["rtt_tracker"]
+    ledger = hass.data[DOMAIN]["ledger"]
+    hass.data[DOMAIN]["address_filter"].add(account_addr)
+    resources.add("address filter", lambda: hass.data[DOMAIN]["address_filter"].discard(account_addr))
 
-    async def get_kwh_to_compensate(call):
+    async def query_kwh_to_compensate() -> bool:
         """
-        HomeAssistant service call instructions to send PubSUb query to get the amount of kWh to compensate based on
-        user's Robonomics account address and current total kWh consumption. Notify user if
+        Send PubSub query to get the amount of kWh to compensate based on user's Robonomics account address and current
+        total kWh consumption. Notify user if failed.
 
-        :param call: Service call parameters.
+        :return: Whether the response was got.
 
         """
         try:
 
-            def callback(obj, update_nr, subscription_id) -> bool:
+            async def handle_response(response: dict):
                 """
-                PubSub subscription callback function to execute at new message arrival. Adds response data to
-                HomeAssistant sensor entities.
-
-                :param obj: Message object.
-                :param update_nr: Events iterator.
-                :param subscription_id: Subscription ID.
+                Apply our response from the response topic to HomeAssistant sensor entities.
 
-                :return: True when message got - to cancel subscription.
+                :param response: Decoded response message.
 
                 """
 
-                response = parse_income_message(obj["params"]["result"]["data"])
-                if response["address"] == hass.data[DOMAIN]["account_addr"]:
-                    _LOGGER.debug(f"response in {LAST_COMPENSATION_DATE_RESPONSE_TOPIC}: {response}")
-                    persistent_notif(
-                        hass,
-                        "Got amount of kWh to compensate!",
-                        f"Last compensated: {response['last_compensation_date'] or 'Never'}, "
-                        f"to compensate: {response['kwh_to_compensate']} kWh.",
-                    )
-
-                    hass.data[DOMAIN][entry.entry_id].set_to_compensate(response["kwh_to_compensate"])
-                    hass.data[DOMAIN][entry.entry_id].set_total_compensated(kwh - response["kwh_to_compensate"])
-                    hass.data[DOMAIN][entry.entry_id].set_last_compensation_date(
-                        response["last_compensation_date"] or "Never"
-                    )
-                    hass.data[DOMAIN][entry.entry_id].publish_updates()
-                    _LOGGER.debug(
-                        f"Updated {DOMAIN}.to_compensate with {response['kwh_to_compensate']}, "
-                        f"{DOMAIN}.previous_compensation_date with {response['last_compensation_date'] or 'Never'}"
-                    )
-                    return True
-
+                _LOGGER.debug(f"response in {LAST_COMPENSATION_DATE_RESPONSE_TOPIC}: {response}")
+                # Measured from the first send even if resent, an upper bound then. Skipping resent queries would
+                # keep only the responses faster than the retry delay and drag the timeouts down to the floor.
+                rtt = None if sent_at is None else monotonic() - sent_at
+                if rtt is not None:
+                    rtt_tracker.add_sample(LAST_COMPENSATION_DATE_RESPONSE_TOPIC, rtt)
+                await persistent_notif_async(
+                    hass,
+                    "Got amount of kWh to compensate!",
+                    f"Last compensated: {response['last_compensation_date'] or 'Never'}, "
+                    f"to compensate: {response['kwh_to_compensate']} kWh.",
+                )
+
+                ledger.record_query(account_addr, kwh, response["kwh_to_compensate"])
+                client.set_to_compensate(response["kwh_to_compensate"])
+                client.set_total_compensated(kwh - response["kwh_to_compensate"])
+                client.set_last_compensation_date(response["last_compensation_date"] or "Never")
+                client.add_sample(kwh, rtt)
+                client.publish_updates()
+                _LOGGER.debug(
+                    f"Updated {DOMAIN}.to_compensate with {response['kwh_to_compensate']}, "
+                    f"{DOMAIN}.previous_compensation_date with {response['last_compensation_date'] or 'Never'}"
+                )
+
+            sent_at = None
             resp_sub = asyncio.ensure_future(
-                subscribe_response_topic_wrapper(LAST_COMPENSATION_DATE_RESPONSE_TOPIC, callback, 10)
+                dispatcher.wait_response(LAST_COMPENSATION_DATE_RESPONSE_TOPIC, account_addr, handle_response, None)
             )
-            await asyncio.sleep(1)
-
-            kwh = 0.0
-            for energy_consumption_entity in hass.data[DOMAIN]["energy_consumption_entities"]:
-                try:
-                    state = float(hass.states.get(energy_consumption_entity).state)
-                    _LOGGER.debug(f"Adding entity {energy_consumption_entity} state {state} to total kwh.")
-                    kwh += state
-                except Exception as e:
-                    _LOGGER.error(f"Error adding entity {energy_consumption_entity} state to total kwh: {e}")
-
-            for energy_production_entity in hass.data[DOMAIN]["energy_production_entities"]:
-                try:
-                    state = float(hass.states.get(energy_production_entity).state)
-                    _LOGGER.debug(f"Subtracting entity {energy_production_entity} state {state} from total kwh.")
-                    kwh -= state
-                except Exception as e:
-                    _LOGGER.error(f"Error subtracting entity {energy_production_entity} from to total kwh: {e}")
 
+            kwh = get_net_kwh(
+                hass,
+                entry_data["energy_consumption_entities"],
+                entry_data["energy_production_entities"],
+            )
             _LOGGER.debug(f"Total kWh: {kwh}")
-            await send_last_compensation_date_query(address=hass.data[DOMAIN]["account_addr"], kwh_current=kwh)
-            await resp_sub
+            timeout = rtt_tracker.timeout(LAST_COMPENSATION_DATE_RESPONSE_TOPIC, DEFAULT_QUERY_TIMEOUT)
+            early_retry = rtt_tracker.percentile(LAST_COMPENSATION_DATE_RESPONSE_TOPIC)
+            if early_retry is not None:
+                early_retry = max(early_retry, rtt_tracker.floor)
+            try:
+                await send_last_compensation_date_query(address=account_addr, kwh_current=kwh, publish=publisher.send)
+                sent_at = monotonic()
+                if conf.get(CONF_EARLY_RETRY, True) and early_retry is not None and early_retry < timeout:
+                    done, _ = await asyncio.wait({resp_sub}, timeout=early_retry)
+                    if not done:
+                        _LOGGER.debug(f"No response in {early_retry:.2f}s, resending kWh query")
+                        await send_last_compensation_date_query(
+                            address=account_addr, kwh_current=kwh, publish=publisher.send
+                        )
+                await asyncio.wait_for(resp_sub, timeout=timeout - (monotonic() - sent_at))
+            finally:
+                resp_sub.cancel()
+            return True
         except asyncio.TimeoutError:
             _LOGGER.error(f"Failed to get amount of kWh to compensate. Pubsub timeout. Notifying the user")
             await persistent_notif_async(
@@ -198,68 +263,93 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
             await persistent_notif_async(
                 hass, "Failed to get amount of kWh to compensate!", "Internal error, check logs for more detail."
             )
+        return False
 
-    async def compensate_kwh(call):
+    async def offset_kwh() -> bool:
         """
-        HomeAssistant service call instructions to send PubSub query to compensate fossil-generated CO2 based on
-        previous call data and home coordinates. Forms liability parameters message and sends it via PubSub.
+        Send PubSub query to compensate fossil-generated CO2 based on previous query data and home coordinates. Forms
+        liability parameters message and sends it via PubSub.
 
-        :param call: Service call parameters.
+        :return: Whether the liability report was got.
 
         """
         try:
 
-            def callback(obj, update_nr, subscription_id):
+            async def handle_response(response: dict):
                 """
-                PubSub subscription callback function to execute at new message arrival. Adds response data to
-                HomeAssistant sensor entities.
+                Apply our response from the response topic to HomeAssistant sensor entities.
 
-                :param obj: Message object.
-                :param update_nr: Events iterator.
-                :param subscription_id: Subscription ID.
-
-                :return: True when message got - to cancel subscription.
+                :param response: Decoded response message.
 
                 """
-                response = parse_income_message(obj["params"]["result"]["data"])
-                if response["address"] == hass.data[DOMAIN]["account_addr"]:
-                    _LOGGER.debug(f"response in {LIABILITY_REPORT_TOPIC}: {response}")
-                    if response["success"]:
-                        persistent_notif(
-                            hass,
-                            "Successful compensation!",
-                            f"Successfully compensated carbon footprint. See Robonomics Liability report {response['report']} for details.",
-                        )
-                        hass.data[DOMAIN][entry.entry_id].set_to_compensate("Yet unknown")
-                        hass.data[DOMAIN][entry.entry_id].set_total_compensated(response["total"])
-                        hass.data[DOMAIN][entry.entry_id].set_last_compensation_date(f"{date.today()}")
-                        hass.data[DOMAIN][entry.entry_id].publish_updates()
-                    else:
-                        persistent_notif(
-                            hass, "Offsetting agent error!", "Failed to burn carbon units. Internal agent error."
-                        )
 
-                    return True
+                _LOGGER.debug(f"response in {LIABILITY_REPORT_TOPIC}: {response}")
+                rtt = None if sent_at is None else monotonic() - sent_at
+                if rtt is not None:
+                    rtt_tracker.add_sample(LIABILITY_REPORT_TOPIC, rtt)
+                ledger.record_report(account_addr, response, kwh)
+                if response["success"]:
+                    await persistent_notif_async(
+                        hass,
+                        "Successful compensation!",
+                        f"Successfully compensated carbon footprint. See Robonomics Liability report {response['report']} for details.",
+                    )
+                    client.set_to_compensate(None)
+                    client.set_total_compensated(response["total"])
+                    client.set_last_compensation_date(f"{date.today()}")
+                    client.add_sample(
+                        get_net_kwh(
+                            hass,
+                            entry_data["energy_consumption_entities"],
+                            entry_data["energy_production_entities"],
+                        ),
+                        rtt,
+                    )
+                    client.publish_updates()
+                    if emissions is not None:
+                        await entry_data["emissions"].async_mark_compensated(emissions["end"])
+                else:
+                    await persistent_notif_async(
+                        hass, "Offsetting agent error!", "Failed to burn carbon units. Internal agent error."
+                    )
 
-            kwh = hass.data[DOMAIN][entry.entry_id].to_compensate
+            kwh = client.to_compensate
+            if kwh is None:
+                await persistent_notif_async(
+                    hass, "Amount to compensate unknown!", "Get the amount of kWh to compensate first."
+                )
+                return False
             if kwh == 0.0:
                 await persistent_notif_async(hass, "Nothing to compensate!", "You have no kWh to compensate.")
-                return
-            resp_sub = asyncio.ensure_future(subscribe_response_topic_wrapper(LIABILITY_REPORT_TOPIC, callback, 120))
-            await asyncio.sleep(1)
+                return False
+            sent_at = None
+            emissions = await get_emissions_summary()
+            resp_sub = asyncio.ensure_future(
+                dispatcher.wait_response(LIABILITY_REPORT_TOPIC, account_addr, handle_response, None)
+            )
 
             coordinates = geo_str
             _LOGGER.debug(f"Set kwh to {kwh}, coordinates to {coordinates}.")
-            await send_offset_query(
-                geo=coordinates,
-                kwh=kwh,
-                ipfs_gw=hass.data[DOMAIN]["ipfs_gw"],
-                ipfs_auth=hass.data[DOMAIN]["ipfs_gw_auth"](),
-                promisee=hass.data[DOMAIN]["account_addr"],
-                liability_signer=hass.data[DOMAIN]["liability"],
-            )
-
-            await resp_sub
+            try:
+                liability_query = await send_offset_query(
+                    geo=coordinates,
+                    kwh=kwh,
+                    ipfs_gateways=entry_data["ipfs_gateways"],
+                    promisee=account_addr,
+                    liability_signer=entry_data["liability"],
+                    publish=publisher.send,
+                    extra_technics=get_extra_technics(emissions),
+                    compress=conf.get(CONF_COMPRESS_TECHNICS, False),
+                    run_in_background=resources.track,
+                )
+                sent_at = monotonic()
+                ledger.record_liability(account_addr, liability_query, kwh)
+                await asyncio.wait_for(
+                    resp_sub, timeout=rtt_tracker.timeout(LIABILITY_REPORT_TOPIC, DEFAULT_LIABILITY_TIMEOUT)
+                )
+            finally:
+                resp_sub.cancel()
+            return True
         except asyncio.TimeoutError:
             _LOGGER.error(f"Failed to compensate kWh. Pubsub timeout. Notifying the user.")
             await persistent_notif_async(
@@ -270,11 +360,243 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
         except Exception as e:
             _LOGGER.error(f"Failed to compensate kWh: {e}")
             await persistent_notif_async(hass, "Failed to compensate!", f"Internal error, check logs for more detail.")
+        return False
+
+    async def get_emissions_summary() -> dict | None:
+        """
+        Process the hours completed since the previous compensation and summarize their emissions.
+
+        :return: Emissions summary or None if there are no statistics or they failed to process.
+
+        """
+        try:
+            await entry_data["emissions"].async_update()
+        except Exception as e:
+            _LOGGER.error(f"Failed to process energy statistics, sending liability without emissions: {e}")
+            return None
+        summary = entry_data["emissions"].summary()
+        _LOGGER.debug(f"Emissions summary: {summary}")
+        return summary
+
+    def get_extra_technics(emissions: dict | None) -> dict:
+        """
+        Technics to pin alongside the coordinates and kWh, detailed as set in the configuration.
+
+        :param emissions: Emissions summary of the compensated period.
+
+        :return: Emissions summary and, in detailed modes, their breakdown per hour or day and meter readings.
+
+        """
+        extra_technics = {} if emissions is None else dict(emissions=emissions)
+        detail = conf.get(CONF_TECHNICS_DETAIL, TECHNICS_DETAIL_SUMMARY)
+        if detail == TECHNICS_DETAIL_SUMMARY:
+            return extra_technics
+        if emissions is not None:
+            extra_technics["breakdown"] = entry_data["emissions"].breakdown(detail)
+        extra_technics["meters"] = get_meter_readings(
+            hass, entry_data["energy_consumption_entities"], entry_data["energy_production_entities"]
+        )
+        return extra_technics
+
+    def get_uncompensated_kwh() -> float | None:
+        """
+        Estimate the amount of kWh consumed since the last compensation from current meter readings.
+
+        :return: Net kWh not yet compensated or None if the total compensated is yet unknown.
+
+        """
+        total_compensated = client.total_compensated
+        if total_compensated is None:
+            return None
+        return (
+            get_net_kwh(
+                hass,
+                entry_data["energy_consumption_entities"],
+                entry_data["energy_production_entities"],
+            )
+            - total_compensated
+        )
+
+    await entry_data["emissions"].async_load()
+
+    # Run as tracked tasks for an unload to cancel them instead of leaving them waiting for responses.
+    entry_data["query"] = lambda: resources.run(query_kwh_to_compensate(), "query")
+    entry_data["compensation_lock"] = asyncio.Lock()
+
+    async def compensate_exclusively() -> bool:
+        """
+        Compensate unless a compensation of the householder is in progress already. The service and the scheduler may
+            trigger one at the same time, both would send a liability for the same queried amount.
+
+        :return: Whether the liability report was got.
+
+        """
+
+        if entry_data["compensation_lock"].locked():
+            _LOGGER.warning(f"Compensation for {account_addr} is in progress already, skipping")
+            return False
+        async with entry_data["compensation_lock"]:
+            return await resources.run(offset_kwh(), "compensate")
+
+    entry_data["compensate"] = compensate_exclusively
+    entry_data["scheduler"] = AutoCompensationScheduler(
+        hass,
+        query=entry_data["query"],
+        compensate=entry_data["compensate"],
+        get_to_compensate=lambda: client.to_compensate,
+        get_uncompensated=get_uncompensated_kwh,
+        watched_entities=conf[CONF_ENERGY_CONSUMPTION_ENTITIES] + conf[CONF_ENERGY_PRODUCTION_ENTITIES],
+        interval_hours=conf.get(CONF_AUTO_INTERVAL, 0),
+        threshold_kwh=conf.get(CONF_AUTO_THRESHOLD, 0),
+        min_batch_kwh=conf.get(CONF_MIN_BATCH, 0),
+        max_jitter=conf.get(CONF_MAX_JITTER, DEFAULT_MAX_JITTER),
+    )
+    entry_data["scheduler"].start()
+    resources.add("scheduler", entry_data["scheduler"].stop)
+
+    await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
+
+    return True
+
+
+async def async_setup_shared(hass: HomeAssistant, conf: dict):
+    """
+    Set up the PubSub transport, the batching publisher, the response dispatcher, the RTT tracker and the services
+        shared by all the entries. Queue, batching and timeouts settings are taken from the first entry set up.
+
+    :param hass: HomeAssistant instance.
+    :param conf: Entry config.
+
+    """
+
+    address_filter = AddressFilter()
+    recorder = TrafficRecorder(hass.config.path(RECORDING_FILE)) if conf.get(CONF_RECORD_TRAFFIC) else None
+    dispatcher = ResponseDispatcher(
+        hass.loop,
+        address_filter,
+        conf.get(CONF_QUEUE_SIZE, DEFAULT_QUEUE_SIZE),
+        conf.get(CONF_QUEUE_OVERFLOW_POLICY, OVERFLOW_DROP_FOREIGN_FIRST),
+        record=None if recorder is None else recorder.record,
+    )
+    dispatcher.start()
+    transport = PubSubTransport(
+        hass.loop,
+        [LAST_COMPENSATION_DATE_RESPONSE_TOPIC, LIABILITY_REPORT_TOPIC],
+        dispatcher.enqueue,
+        agent_multiaddr=conf.get(CONF_AGENT_MULTIADDR, AGENT_NODE_MULTIADDR),
+    )
+    transport.start()
+    publisher = BatchPublisher(
+        hass.loop,
+        transport.publish,
+        conf.get(CONF_BATCH_SIZE, DEFAULT_BATCH_SIZE),
+        conf.get(CONF_BATCH_LINGER, DEFAULT_BATCH_LINGER),
+    )
+    rtt_tracker = RttTracker(
+        hass,
+        conf.get(CONF_TIMEOUT_PERCENTILE, DEFAULT_TIMEOUT_PERCENTILE),
+        conf.get(CONF_TIMEOUT_MULTIPLIER, DEFAULT_TIMEOUT_MULTIPLIER),
+        conf.get(CONF_TIMEOUT_FLOOR, DEFAULT_TIMEOUT_FLOOR),
+        conf.get(CONF_TIMEOUT_CEILING, DEFAULT_TIMEOUT_CEILING),
+    )
+    ledger = CompensationLedger(hass.loop, hass.config.path(LEDGER_FILE))
+    resources = ResourceRegistry("Shared resources")
+    resources.add("dispatcher", dispatcher.stop)
+    resources.add("transport", transport.stop)
+    resources.add("publisher", publisher.stop)
+    # Stored before any await for entries set up concurrently to find them.
+    hass.data[DOMAIN]["resources"] = resources
+    hass.data[DOMAIN]["address_filter"] = address_filter
+    hass.data[DOMAIN]["dispatcher"] = dispatcher
+    hass.data[DOMAIN]["transport"] = transport
+    hass.data[DOMAIN]["publisher"] = publisher
+    hass.data[DOMAIN]["rtt_tracker"] = rtt_tracker
+    hass.data[DOMAIN]["ledger"] = ledger
+    hass.data[DOMAIN]["recorder"] = recorder
+
+    async def get_kwh_to_compensate(call):
+        """
+        HomeAssistant service call instructions to get the amount of kWh to compensate.
+
+        :param call: Service call parameters.
+
+        """
+        await asyncio.gather(*(data["query"]() for data in get_entries_data(hass, call.data.get(ATTR_ADDRESS))))
+
+    async def compensate_kwh(call):
+        """
+        HomeAssistant service call instructions to compensate the amount of kWh got by the previous query.
+
+        :param call: Service call parameters.
+
+        """
+        await asyncio.gather(*(data["compensate"]() for data in get_entries_data(hass, call.data.get(ATTR_ADDRESS))))
+
+    async def get_compensation_history(call: ServiceCall) -> ServiceResponse:
+        """
+        HomeAssistant service call instructions to get compensation history from the local ledger.
+
+        :param call: Service call parameters.
+
+        :return: Ledger records or kWh compensated per period.
+
+        """
+        start = call.data.get(ATTR_START)
+        end = call.data.get(ATTR_END)
+        records = await ledger.async_query(
+            address=call.data.get(ATTR_ADDRESS),
+            start=dt_util.as_timestamp(dt_util.start_of_local_day(start)) if start else None,
+            end=dt_util.as_timestamp(dt_util.start_of_local_day(end + timedelta(days=1))) if end else None,
+            kind=call.data.get(ATTR_KIND),
+            group_by=call.data.get(ATTR_GROUP_BY),
+        )
+        return {"records": records}
+
+    async def replay_traffic(call: ServiceCall) -> ServiceResponse:
+        """
+        HomeAssistant service call instructions to replay recorded PubSub traffic through a separate dispatch
+            pipeline with the current queue settings.
+
+        :param call: Service call parameters.
+
+        :return: Replay report.
+
+        """
+        return await replay_recording(
+            hass.loop,
+            hass.config.path(call.data[ATTR_FILE]),
+            [data["account_addr"] for data in get_entries_data(hass)],
+            conf.get(CONF_QUEUE_SIZE, DEFAULT_QUEUE_SIZE),
+            conf.get(CONF_QUEUE_OVERFLOW_POLICY, OVERFLOW_DROP_FOREIGN_FIRST),
+            speed=call.data[ATTR_SPEED],
+        )
 
     hass.services.async_register(DOMAIN, "get_amount_of_kwh_to_compensate", get_kwh_to_compensate)
     hass.services.async_register(DOMAIN, "compensate_kwh", compensate_kwh)
+    hass.services.async_register(
+        DOMAIN,
+        "get_compensation_history",
+        get_compensation_history,
+        schema=COMPENSATION_HISTORY_SCHEMA,
+        supports_response=SupportsResponse.ONLY,
+    )
+    hass.services.async_register(
+        DOMAIN,
+        "replay_traffic",
+        replay_traffic,
+        schema=REPLAY_TRAFFIC_SCHEMA,
+        supports_response=SupportsResponse.ONLY,
+    )
 
-    return True
+    for service in ("get_amount_of_kwh_to_compensate", "compensate_kwh", "get_compensation_history", "replay_traffic"):
+        resources.add(f"service {service}", lambda service=service: hass.services.async_remove(DOMAIN, service))
+
+    if recorder is not None:
+        await hass.async_add_executor_job(recorder.open)
+        resources.add("traffic recorder", lambda: hass.async_add_executor_job(recorder.close))
+    await ledger.async_start()
+    resources.add("ledger", ledger.async_stop)
+    await rtt_tracker.async_load()
 
 
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
@@ -288,26 +610,112 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
 
     unload_ok = await hass.config_entries.async_forward_entry_unload(entry, PLATFORMS)
     if unload_ok:
-        hass.data[DOMAIN].pop(entry.entry_id)
+        entry_data = hass.data[DOMAIN].pop(entry.entry_id)
+        # Let the next household set up carry the shared PubSub queue sensor.
+        if hass.data[DOMAIN].get("pubsub_queue_entry") == entry.entry_id:
+            del hass.data[DOMAIN]["pubsub_queue_entry"]
+        cost = await entry_data["resources"].async_teardown()
+        _LOGGER.info(f"Released resources of {entry.title}: {cost}")
+        if not get_entries_data(hass):
+            cost = await hass.data.pop(DOMAIN)["resources"].async_teardown()
+            _LOGGER.info(f"Released shared resources: {cost}")
 
     return unload_ok
 
 
-def persistent_notif(hass: HomeAssistant, title: str, message: str):
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Remove the data cached for a config entry.
+
+    :param hass: HomeAssistant instance.
+    :param entry: Configuration entry.
+
+    """
+
+    account_addr = Account(seed=entry.data[CONF_ADMIN_SEED], crypto_type=KeypairType.ED25519).get_address()
+    await async_remove_emissions(hass, account_addr)
+
+
+def get_entries_data(hass: HomeAssistant, address: str | None = None) -> list:
     """
-    Create persistent notification in HomeAssistant UI.
+    Get data of the entries set up, optionally of one householder only.
 
     :param hass: HomeAssistant instance.
-    :param title: Notification title.
-    :param message: Notification message.
+    :param address: Householder address in Robonomics Parachain. All the householders if not given.
+
+    :return: List of entries data.
+
     """
-    hass.services.call(
-        domain="notify",
-        service="persistent_notification",
-        service_data=dict(
-            message=message,
-            title=title,
-        ),
+
+    return [
+        hass.data[DOMAIN][entry.entry_id]
+        for entry in hass.config_entries.async_entries(DOMAIN)
+        if entry.entry_id in hass.data[DOMAIN]
+        and (address is None or hass.data[DOMAIN][entry.entry_id]["account_addr"] == address)
+    ]
+
+
+def get_net_kwh(hass: HomeAssistant, consumption_entities: list, production_entities: list) -> float:
+    """
+    Calculate current total kWh consumption subtracted with total kWh production.
+
+    :param hass: HomeAssistant instance.
+    :param consumption_entities: Energy consumption entities.
+    :param production_entities: Energy production entities.
+
+    :return: Net kWh.
+
+    """
+
+    kwh = 0.0
+    for energy_consumption_entity in consumption_entities:
+        try:
+            state = float(hass.states.get(energy_consumption_entity).state)
+            _LOGGER.debug(f"Adding entity {energy_consumption_entity} state {state} to total kwh.")
+            kwh += state
+        except Exception as e:
+            _LOGGER.error(f"Error adding entity {energy_consumption_entity} state to total kwh: {e}")
+
+    for energy_production_entity in production_entities:
+        try:
+            state = float(hass.states.get(energy_production_entity).state)
+            _LOGGER.debug(f"Subtracting entity {energy_production_entity} state {state} from total kwh.")
+            kwh -= state
+        except Exception as e:
+            _LOGGER.error(f"Error subtracting entity {energy_production_entity} from to total kwh: {e}")
+
+    return kwh
+
+
+def get_meter_readings(hass: HomeAssistant, consumption_entities: list, production_entities: list) -> dict:
+    """
+    Current readings of the energy entities.
+
+    :param hass: HomeAssistant instance.
+    :param consumption_entities: Energy entities representing total devices' consumption.
+    :param production_entities: Energy entities representing total energy production.
+
+    :return: Consumption and production readings, each as entity ID mapped to its state, unit and reading time.
+
+    """
+
+    def reading(entity: str) -> dict:
+        """Reading of one entity, state is None if unavailable."""
+        state = hass.states.get(entity)
+        if state is None:
+            return dict(state=None, unit=None, updated=None)
+        try:
+            value = float(state.state)
+        except ValueError:
+            value = None
+        return dict(
+            state=value,
+            unit=state.attributes.get("unit_of_measurement"),
+            updated=state.last_updated.isoformat(),
+        )
+
+    return dict(
+        consumption={entity: reading(entity) for entity in consumption_entities},
+        production={entity: reading(entity) for entity in production_entities},
     )
 
 
@@ -6,23 +6,28 @@ import logging
 
 from homeassistant.core import HomeAssistant
 
+from .const import HISTORY_CAPACITY
+from .utils.history import SampleHistory
+
 _LOGGER = logging.getLogger(__name__)
 
 
 class Client:
     """Offsetting Client class."""
 
-    def __init__(self, hass: HomeAssistant) -> None:
+    def __init__(self, hass: HomeAssistant, client_id: str, name: str) -> None:
         """
         Class init function, sets all class attributes.
 
         :param hass: HomeAssistant instance.
+        :param client_id: Client ID, unique per householder.
+        :param name: Client device name.
 
         """
 
-        _LOGGER.debug(f"Initiating Client")
-        self.name = "Carbon Offsetting Client"
-        self._id = "carbon_offsetting_client"
+        _LOGGER.debug(f"Initiating Client {client_id}")
+        self.name = name
+        self._id = client_id
         self.sw_version = "0.0.1"
         self.model = "Carbon Offsetting Client"
         self.manufacturer = "Robonomics"
@@ -31,9 +36,10 @@ class Client:
         self._callbacks = set()
         self._loop = asyncio.get_event_loop()
 
-        self._to_compensate = "Yet unknown"
-        self._last_compensation_date = "Yet unknown"
-        self._total_compensated = "Yet unknown"
+        self._to_compensate: float | None = None
+        self._last_compensation_date: str | None = None
+        self._total_compensated: float | None = None
+        self.history = SampleHistory(HISTORY_CAPACITY)
 
     @property
     def client_id(self) -> str:
@@ -45,15 +51,15 @@ class Client:
         return self._id
 
     @property
-    def to_compensate(self) -> float | str:
+    def to_compensate(self) -> float | None:
         """
-        Amount of kWh to compensate.
+        Amount of kWh to compensate, None if yet unknown.
 
         """
 
         return self._to_compensate
 
-    def set_to_compensate(self, val: float):
+    def set_to_compensate(self, val: float | None):
         """
         Set amount of kWh to compensate.
 
@@ -64,9 +70,9 @@ class Client:
         self._to_compensate = val
 
     @property
-    def last_compensation_date(self) -> str:
+    def last_compensation_date(self) -> str | None:
         """
-        Last compensation date.
+        Last compensation date, None if yet unknown.
 
         """
 
@@ -83,9 +89,9 @@ class Client:
         self._last_compensation_date = val
 
     @property
-    def total_compensated(self) -> float | str:
+    def total_compensated(self) -> float | None:
         """
-        Amount of kWh total compensated.
+        Amount of kWh total compensated, None if yet unknown.
 
         """
 
@@ -101,6 +107,35 @@ class Client:
 
         self._total_compensated = val
 
+    def add_sample(self, net_kwh: float, rtt: float | None) -> None:
+        """
+        Add a query or compensation outcome to the history, with the current total compensated.
+
+        :param net_kwh: Net kWh consumed in total.
+        :param rtt: Response round-trip time, s, None if not measured.
+
+        """
+
+        self.history.add(net_kwh, self._total_compensated, rtt)
+
+    @property
+    def compensation_rate(self) -> float | None:
+        """
+        Share of the energy consumed recently that got compensated, %.
+
+        """
+
+        return self.history.compensation_rate
+
+    @property
+    def average_rtt(self) -> float | None:
+        """
+        Average agent response time over the recent queries and compensations, s.
+
+        """
+
+        return self.history.average_rtt
+
     @property
     def online(self) -> float:
         """
@@ -11,19 +11,66 @@ from homeassistant.core import HomeAssistant
 from homeassistant.data_entry_flow import FlowResult
 from homeassistant.helpers.selector import selector
 from robonomicsinterface import Account
+from substrateinterface import KeypairType
 
 from .const import (
+    AGENT_NODE_MULTIADDR,
     CONF_ADMIN_SEED,
+    CONF_AGENT_MULTIADDR,
+    CONF_AGENT_MULTIADDRS,
+    CONF_AUTO_INTERVAL,
+    CONF_AUTO_THRESHOLD,
+    CONF_BATCH_LINGER,
+    CONF_BATCH_SIZE,
+    CONF_CARBON_INTENSITY,
+    CONF_COMPRESS_TECHNICS,
+    CONF_EARLY_RETRY,
     CONF_ENERGY_CONSUMPTION_ENTITIES,
     CONF_ENERGY_PRODUCTION_ENTITIES,
+    CONF_IPFS_EXTRA_GWS,
     CONF_IPFS_GATEWAY_AUTH,
     CONF_IPFS_GATEWAY_PWD,
     CONF_IPFS_GW,
+    CONF_IPFS_GW_RANKING,
     CONF_IS_W3GW,
+    CONF_MAX_JITTER,
+    CONF_MIN_BATCH,
+    CONF_QUEUE_OVERFLOW_POLICY,
+    CONF_QUEUE_SIZE,
+    CONF_RECORD_TRAFFIC,
+    CONF_TECHNICS_DETAIL,
+    CONF_TIMEOUT_CEILING,
+    CONF_TIMEOUT_FLOOR,
+    CONF_TIMEOUT_MULTIPLIER,
+    CONF_TIMEOUT_PERCENTILE,
     CONF_WARN_DATA_SENDING,
+    DEFAULT_BATCH_LINGER,
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_CARBON_INTENSITY,
+    DEFAULT_MAX_JITTER,
+    DEFAULT_QUEUE_SIZE,
+    DEFAULT_TIMEOUT_CEILING,
+    DEFAULT_TIMEOUT_FLOOR,
+    DEFAULT_TIMEOUT_MULTIPLIER,
+    DEFAULT_TIMEOUT_PERCENTILE,
     DOMAIN,
+    OVERFLOW_DROP_FOREIGN_FIRST,
+    OVERFLOW_DROP_OLDEST,
+    PROBE_TIMEOUT,
+    TECHNICS_DETAIL_DAILY,
+    TECHNICS_DETAIL_HOURLY,
+    TECHNICS_DETAIL_SUMMARY,
 )
-from .exceptions import InvalidIPFSCreds, InvalidSeed
+from .exceptions import (
+    InvalidAgentMultiaddrs,
+    InvalidIntensityProfile,
+    InvalidIPFSCreds,
+    InvalidSeed,
+    InvalidTimeouts,
+)
+from .utils.emissions import parse_intensity_profile
+from .utils.ipfs import get_ipfs_gateways, parse_extra_ipfs_gateways
+from .utils.probe import format_probe_results, parse_agent_multiaddrs, probe_endpoints
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -40,9 +87,40 @@ STEP_CONF_DATA_SCHEMA = vol.Schema(
         vol.Optional(CONF_IS_W3GW): bool,
         vol.Optional(CONF_IPFS_GATEWAY_AUTH): str,
         vol.Optional(CONF_IPFS_GATEWAY_PWD): str,
+        vol.Optional(CONF_IPFS_EXTRA_GWS): str,
+        vol.Optional(CONF_AGENT_MULTIADDRS, default=AGENT_NODE_MULTIADDR): str,
+        vol.Optional(CONF_QUEUE_SIZE, default=DEFAULT_QUEUE_SIZE): vol.All(int, vol.Range(min=1)),
+        vol.Optional(CONF_QUEUE_OVERFLOW_POLICY, default=OVERFLOW_DROP_FOREIGN_FIRST): selector(
+            {"select": {"options": [OVERFLOW_DROP_FOREIGN_FIRST, OVERFLOW_DROP_OLDEST]}}
+        ),
+        vol.Optional(CONF_TIMEOUT_PERCENTILE, default=DEFAULT_TIMEOUT_PERCENTILE): vol.All(
+            vol.Coerce(float), vol.Range(min=1, max=100)
+        ),
+        vol.Optional(CONF_TIMEOUT_MULTIPLIER, default=DEFAULT_TIMEOUT_MULTIPLIER): vol.All(
+            vol.Coerce(float), vol.Range(min=1)
+        ),
+        vol.Optional(CONF_TIMEOUT_FLOOR, default=DEFAULT_TIMEOUT_FLOOR): vol.All(vol.Coerce(float), vol.Range(min=1)),
+        vol.Optional(CONF_TIMEOUT_CEILING, default=DEFAULT_TIMEOUT_CEILING): vol.All(
+            vol.Coerce(float), vol.Range(min=1)
+        ),
+        vol.Optional(CONF_EARLY_RETRY, default=True): bool,
+        vol.Optional(CONF_AUTO_INTERVAL, default=0): vol.All(vol.Coerce(float), vol.Range(min=0)),
+        vol.Optional(CONF_AUTO_THRESHOLD, default=0): vol.All(vol.Coerce(float), vol.Range(min=0)),
+        vol.Optional(CONF_MIN_BATCH, default=0): vol.All(vol.Coerce(float), vol.Range(min=0)),
+        vol.Optional(CONF_MAX_JITTER, default=DEFAULT_MAX_JITTER): vol.All(vol.Coerce(float), vol.Range(min=0)),
+        vol.Optional(CONF_BATCH_SIZE, default=DEFAULT_BATCH_SIZE): vol.All(int, vol.Range(min=1)),
+        vol.Optional(CONF_BATCH_LINGER, default=DEFAULT_BATCH_LINGER): vol.All(vol.Coerce(float), vol.Range(min=0)),
+        vol.Optional(CONF_CARBON_INTENSITY, default=DEFAULT_CARBON_INTENSITY): str,
+        vol.Optional(CONF_RECORD_TRAFFIC, default=False): bool,
+        vol.Optional(CONF_TECHNICS_DETAIL, default=TECHNICS_DETAIL_SUMMARY): selector(
+            {"select": {"options": [TECHNICS_DETAIL_SUMMARY, TECHNICS_DETAIL_DAILY, TECHNICS_DETAIL_HOURLY]}}
+        ),
+        vol.Optional(CONF_COMPRESS_TECHNICS, default=False): bool,
     }
 )
 
+STEP_PROBE_DATA_SCHEMA = vol.Schema({})
+
 STEP_WARN_DATA_SCHEMA = vol.Schema(
     {
         vol.Required(CONF_WARN_DATA_SENDING): bool,
@@ -65,6 +143,18 @@ def is_valid_sub_admin_seed(sub_admin_seed: str) -> Optional[ValueError]:
         return e
 
 
+def get_address(sub_admin_seed: str) -> str:
+    """
+    Get householder address the liabilities are signed with.
+
+    :param sub_admin_seed: HomeAssistant user's Robonomics Account seed in any form.
+
+    :return: Robonomics account address.
+
+    """
+    return Account(sub_admin_seed, crypto_type=KeypairType.ED25519).get_address()
+
+
 def is_valid_ipfs_creds(data: dict) -> bool:
     """
     Check whether supplied IPFS credentials are correct.
@@ -80,6 +170,10 @@ def is_valid_ipfs_creds(data: dict) -> bool:
         return False
     if CONF_IPFS_GATEWAY_PWD in data and CONF_IPFS_GATEWAY_AUTH not in data:
         return False
+    try:
+        parse_extra_ipfs_gateways(data.get(CONF_IPFS_EXTRA_GWS, ""))
+    except ValueError:
+        return False
     return True
 
 
@@ -91,15 +185,28 @@ async def validate_input(hass: HomeAssistant, data: dict[str, Any]) -> dict[str,
     :param hass: HomeAssistant instance.
     :param data: User input.
 
-    :return: Integration setup title.
+    :return: Integration setup title and householder address.
 
     """
     if await hass.async_add_executor_job(is_valid_sub_admin_seed, data[CONF_ADMIN_SEED]):
         raise InvalidSeed
     if not await hass.async_add_executor_job(is_valid_ipfs_creds, data):
         raise InvalidIPFSCreds
+    if data[CONF_TIMEOUT_FLOOR] > data[CONF_TIMEOUT_CEILING]:
+        raise InvalidTimeouts
+    try:
+        parse_intensity_profile(data[CONF_CARBON_INTENSITY])
+    except ValueError:
+        raise InvalidIntensityProfile
+    try:
+        if not parse_agent_multiaddrs(data[CONF_AGENT_MULTIADDRS]):
+            raise ValueError("No agent multiaddrs")
+    except ValueError:
+        raise InvalidAgentMultiaddrs
+
+    address = await hass.async_add_executor_job(get_address, data[CONF_ADMIN_SEED])
 
-    return {"title": "Carbon Offsetting Web3"}
+    return {"title": f"Carbon Offsetting Web3 {address[:8]}", "address": address}
 
 
 class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
@@ -109,6 +216,12 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     # Home Assistant will call your migrate method if the version changes
     VERSION = 1
 
+    def __init__(self) -> None:
+        """Class init function, sets the state kept between the steps."""
+        self._data: dict[str, Any] = {}
+        self._title = ""
+        self._probe_placeholders: dict[str, str] = {}
+
     async def async_step_user(self, user_input: dict[str, Any] | None = None) -> FlowResult:
         """
         User step of integration installation. Shows warnings.
@@ -120,9 +233,6 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         """
 
         errors = {}
-        device_unique_id = "carbon_offsetting_web3"
-        await self.async_set_unique_id(device_unique_id)
-        self._abort_if_unique_id_configured()
         if user_input is None:
             return self.async_show_form(step_id="user", data_schema=STEP_WARN_DATA_SCHEMA)
         else:
@@ -154,7 +264,55 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         except InvalidIPFSCreds:
             errors["base"] = "invalid_ipfs_creds"
             _LOGGER.exception("invalid_ipfs_creds")
+        except InvalidTimeouts:
+            errors["base"] = "invalid_timeouts"
+            _LOGGER.exception("invalid_timeouts")
+        except InvalidIntensityProfile:
+            errors["base"] = "invalid_intensity_profile"
+            _LOGGER.exception("invalid_intensity_profile")
+        except InvalidAgentMultiaddrs:
+            errors["base"] = "invalid_agent_multiaddrs"
+            _LOGGER.exception("invalid_agent_multiaddrs")
         else:
-            return self.async_create_entry(title=info["title"], data=user_input)
+            await self.async_set_unique_id(info["address"])
+            self._abort_if_unique_id_configured()
+
+            ipfs_results, agent_results = await probe_endpoints(
+                get_ipfs_gateways(user_input), parse_agent_multiaddrs(user_input[CONF_AGENT_MULTIADDRS]), PROBE_TIMEOUT
+            )
+            _LOGGER.debug(f"Probe results: IPFS {ipfs_results}, agents {agent_results}")
+            if ipfs_results[0][1] is None:
+                errors["base"] = "ipfs_unreachable"
+            elif agent_results[0][1] is None:
+                errors["base"] = "agent_unreachable"
+            else:
+                self._data = {
+                    **user_input,
+                    CONF_IPFS_GW_RANKING: [endpoint for endpoint, _, _ in ipfs_results],
+                    CONF_AGENT_MULTIADDR: agent_results[0][0],
+                }
+                self._title = info["title"]
+                self._probe_placeholders = {
+                    "ipfs_latencies": format_probe_results(ipfs_results),
+                    "agent_latencies": format_probe_results(agent_results),
+                }
+                return await self.async_step_probe()
 
         return self.async_show_form(step_id="conf", data_schema=STEP_CONF_DATA_SCHEMA, errors=errors)
+
+    async def async_step_probe(self, user_input: dict[str, Any] | None = None) -> FlowResult:
+        """
+        Probe results step of integration installation. Shows measured endpoints latencies, the fastest ones are
+            used by default.
+
+        :param user_input: User input.
+
+        :return: Setup entry.
+
+        """
+        if user_input is None:
+            return self.async_show_form(
+                step_id="probe", data_schema=STEP_PROBE_DATA_SCHEMA, description_placeholders=self._probe_placeholders
+            )
+
+        return self.async_create_entry(title=self._title, data=self._data)
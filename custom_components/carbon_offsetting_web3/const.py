@@ -2,16 +2,47 @@
 
 DOMAIN = "carbon_offsetting_web3"
 CONF_IP = "ip"
+CLIENT_ID = "carbon_offsetting_client"
+ATTR_ADDRESS = "address"
+ATTR_START = "start"
+ATTR_END = "end"
+ATTR_KIND = "kind"
+ATTR_GROUP_BY = "group_by"
+ATTR_FILE = "file"
+ATTR_SPEED = "speed"
 PLATFORMS = ["sensor"]
 
 CONF_ENERGY_CONSUMPTION_ENTITIES = "energy_consumption_entities"
 CONF_ENERGY_PRODUCTION_ENTITIES = "energy_production_entities"
 CONF_ADMIN_SEED = "admin_seed_secret"
 CONF_WARN_DATA_SENDING = "warn_data_sending"
+CONF_CLIENT_ID = "client_id"
 CONF_IPFS_GW = "ipfs_gw"
 CONF_IS_W3GW = "is_ipfs_gw_w3"
 CONF_IPFS_GATEWAY_AUTH = "ipfs_gw_auth"
 CONF_IPFS_GATEWAY_PWD = "ipfs_gw_pwd_secret"
+CONF_IPFS_EXTRA_GWS = "ipfs_extra_gws_secret"
+CONF_QUEUE_SIZE = "queue_size"
+CONF_QUEUE_OVERFLOW_POLICY = "queue_overflow_policy"
+CONF_TIMEOUT_PERCENTILE = "timeout_percentile"
+CONF_TIMEOUT_MULTIPLIER = "timeout_multiplier"
+CONF_TIMEOUT_FLOOR = "timeout_floor"
+CONF_TIMEOUT_CEILING = "timeout_ceiling"
+CONF_EARLY_RETRY = "early_retry"
+CONF_AUTO_INTERVAL = "auto_interval_hours"
+CONF_AUTO_THRESHOLD = "auto_threshold_kwh"
+CONF_MIN_BATCH = "min_batch_kwh"
+CONF_MAX_JITTER = "max_jitter"
+CONF_BATCH_SIZE = "batch_size"
+CONF_BATCH_LINGER = "batch_linger"
+CONF_RECORD_TRAFFIC = "record_traffic"
+CONF_AGENT_MULTIADDRS = "agent_multiaddrs"
+CONF_AGENT_MULTIADDR = "agent_multiaddr"
+CONF_IPFS_GW_RANKING = "ipfs_gw_ranking"
+
+IPFS_AUTH_NONE = "none"
+IPFS_AUTH_W3 = "w3"
+IPFS_AUTH_LOGIN = "login"
 
 IPFS_GW = "/ip4/127.0.0.1/tcp/5001/http"
 AGENT_NODE_MULTIADDR = "/dns/robonomics.rpc.multi-agent.io/tcp/44440"
@@ -20,3 +51,47 @@ LAST_COMPENSATION_DATE_QUERY_TOPIC = "last_compensation_date_query"
 LAST_COMPENSATION_DATE_RESPONSE_TOPIC = "last_compensation_date_response"
 LIABILITY_QUERY_TOPIC = "liability_query"
 LIABILITY_REPORT_TOPIC = "liability_report"
+
+DEFAULT_QUEUE_SIZE = 64
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_DROP_FOREIGN_FIRST = "drop_foreign_first"
+
+DEFAULT_QUERY_TIMEOUT = 10
+DEFAULT_LIABILITY_TIMEOUT = 120
+DEFAULT_TIMEOUT_PERCENTILE = 95
+DEFAULT_TIMEOUT_MULTIPLIER = 2.0
+DEFAULT_TIMEOUT_FLOOR = 5
+DEFAULT_TIMEOUT_CEILING = 300
+RTT_WINDOW = 50
+MIN_RTT_SAMPLES = 5
+RTT_STORAGE_VERSION = 1
+RTT_SAVE_DELAY = 30
+
+DEFAULT_MAX_JITTER = 300
+AUTO_THRESHOLD_COOLDOWN = 3600
+SUBSCRIPTION_RETRY_DELAY = 5
+DEFAULT_BATCH_SIZE = 1
+DEFAULT_BATCH_LINGER = 0.5
+LEDGER_FILE = "carbon_offsetting_web3.db"
+LEDGER_FLUSH_INTERVAL = 10
+LEDGER_MAX_BATCH = 100
+LEDGER_MAX_BUFFER = 10000
+CONF_CARBON_INTENSITY = "carbon_intensity_profile"
+DEFAULT_CARBON_INTENSITY = "475"
+EMISSIONS_STORAGE_VERSION = 1
+EMISSIONS_INITIAL_HOURS = 24 * 31
+EMISSIONS_MAX_HOURS = 24 * 366
+EMISSIONS_SETTLE_HOURS = 1
+RECORDING_FILE = "carbon_offsetting_web3.rec"
+RECORDING_MAX_BYTES = 64 * 1024 * 1024
+REPLAY_DRAIN_TIMEOUT = 60
+PROBE_TIMEOUT = 15
+RESOURCE_TEARDOWN_TIMEOUT = 10
+SUBSCRIPTION_ABORT_INTERVAL = 0.1
+CONF_TECHNICS_DETAIL = "technics_detail"
+CONF_COMPRESS_TECHNICS = "compress_technics"
+TECHNICS_DETAIL_SUMMARY = "summary"
+TECHNICS_DETAIL_DAILY = "daily"
+TECHNICS_DETAIL_HOURLY = "hourly"
+TECHNICS_ENCODING_GZIP = "gzip+base64"
+HISTORY_CAPACITY = 256
@@ -11,3 +11,15 @@ class InvalidIPFSCreds(HomeAssistantError):
     Given IPFS credential don't match (i.e. no password given for auth or auth/pwd given
         alongside with web3-auth tick).
     """
+
+
+class InvalidTimeouts(HomeAssistantError):
+    """Given timeout floor is greater than timeout ceiling."""
+
+
+class InvalidAgentMultiaddrs(HomeAssistantError):
+    """Given agent node multiaddrs are malformed."""
+
+
+class InvalidIntensityProfile(HomeAssistantError):
+    """Given carbon intensity profile is neither one nor 24 non-negative numbers."""
@@ -0,0 +1,169 @@
+"""Scheduled auto-compensation: query-then-compensate pipeline run on a schedule or on a kWh threshold."""
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import typing as tp
+from datetime import timedelta
+from time import monotonic
+
+from homeassistant.core import Event, HomeAssistant, callback
+from homeassistant.helpers.event import async_track_state_change_event, async_track_time_interval
+
+from .const import AUTO_THRESHOLD_COOLDOWN
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class AutoCompensationScheduler:
+    """Runs the query-then-compensate pipeline periodically and/or when uncompensated kWh crosses a threshold."""
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        query: tp.Callable[[], tp.Awaitable[bool]],
+        compensate: tp.Callable[[], tp.Awaitable[bool]],
+        get_to_compensate: tp.Callable[[], float | None],
+        get_uncompensated: tp.Callable[[], float | None],
+        watched_entities: tp.List[str],
+        interval_hours: float,
+        threshold_kwh: float,
+        min_batch_kwh: float,
+        max_jitter: float,
+    ) -> None:
+        """
+        Class init function, sets all class attributes.
+
+        :param hass: HomeAssistant instance.
+        :param query: Coroutine function querying the amount of kWh to compensate. Returns success flag.
+        :param compensate: Coroutine function compensating the queried amount. Returns success flag.
+        :param get_to_compensate: Function returning the queried amount of kWh to compensate.
+        :param get_uncompensated: Function estimating kWh consumed since the last compensation from meter readings.
+        :param watched_entities: Energy entities to check the threshold on state change of.
+        :param interval_hours: Pipeline run interval, h. 0 to disable scheduled runs.
+        :param threshold_kwh: Uncompensated kWh to trigger a run at. 0 to disable threshold runs.
+        :param min_batch_kwh: Minimum amount of kWh worth a liability. Smaller amounts are left for the next run.
+        :param max_jitter: Maximum random delay before each run, s.
+
+        """
+
+        self._hass = hass
+        self._query = query
+        self._compensate = compensate
+        self._get_to_compensate = get_to_compensate
+        self._get_uncompensated = get_uncompensated
+        self._watched_entities = watched_entities
+        self._interval_hours = interval_hours
+        self._threshold_kwh = threshold_kwh
+        self._min_batch_kwh = min_batch_kwh
+        self._max_jitter = max_jitter
+
+        self._lock = asyncio.Lock()
+        self._last_threshold_run: float | None = None
+        self._last_total_query: float | None = None
+        self._unsubs: tp.List[tp.Callable[[], None]] = []
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        """Start tracking time and energy entities according to the configuration."""
+        if self._interval_hours:
+            self._unsubs.append(
+                async_track_time_interval(self._hass, self._on_interval, timedelta(hours=self._interval_hours))
+            )
+            _LOGGER.debug(f"Auto-compensation scheduled every {self._interval_hours}h")
+        if self._threshold_kwh and self._watched_entities:
+            self._unsubs.append(
+                async_track_state_change_event(self._hass, self._watched_entities, self._on_state_change)
+            )
+            _LOGGER.debug(f"Auto-compensation triggered at {self._threshold_kwh} kWh")
+            # The threshold is checked against the total compensated, unknown until the first query.
+            self._last_total_query = monotonic()
+            self._start_run("startup", query_only=True)
+
+    def stop(self) -> None:
+        """Stop tracking and cancel the run in progress."""
+        while self._unsubs:
+            self._unsubs.pop()()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _start_run(self, reason: str, query_only: bool = False) -> None:
+        """
+        Start a run in background, keeping its task to cancel on stop.
+
+        :param reason: What triggered the run, for logging.
+        :param query_only: Whether to only query the amount of kWh to compensate.
+
+        """
+
+        if self._task is None or self._task.done():
+            self._task = self._hass.async_create_task(self.run(reason, query_only))
+        else:
+            _LOGGER.debug(f"Auto-compensation triggered by {reason} merged into the run in progress")
+
+    @callback
+    def _on_interval(self, now) -> None:
+        """
+        Scheduled run.
+
+        :param now: Current time.
+
+        """
+
+        self._start_run("schedule")
+
+    @callback
+    def _on_state_change(self, event: Event) -> None:
+        """
+        Check the threshold when an energy entity changes. Threshold runs are at most once per cooldown, so a run
+            failing or leaving kWh below the minimum batch doesn't repeat on every meter update.
+
+        :param event: State changed event.
+
+        """
+
+        if self._lock.locked():
+            return
+        uncompensated = self._get_uncompensated()
+        if uncompensated is None:
+            # The startup query failed, retry it at most once per cooldown to get the total compensated.
+            if self._last_total_query is None or monotonic() - self._last_total_query >= AUTO_THRESHOLD_COOLDOWN:
+                self._last_total_query = monotonic()
+                self._start_run("unknown total compensated", query_only=True)
+            return
+        if self._last_threshold_run is not None and monotonic() - self._last_threshold_run < AUTO_THRESHOLD_COOLDOWN:
+            return
+        if uncompensated >= self._threshold_kwh:
+            self._last_threshold_run = monotonic()
+            self._start_run("threshold")
+
+    async def run(self, reason: str, query_only: bool = False) -> None:
+        """
+        Query the amount of kWh to compensate and compensate it if worth a liability. Triggers coming while a run is
+            in progress are merged into it.
+
+        :param reason: What triggered the run, for logging.
+        :param query_only: Whether to only query the amount of kWh to compensate.
+
+        """
+
+        if self._lock.locked():
+            _LOGGER.debug(f"Auto-compensation triggered by {reason} merged into the run in progress")
+            return
+        async with self._lock:
+            jitter = random.uniform(0, self._max_jitter)
+            _LOGGER.debug(f"Auto-compensation triggered by {reason}, starting in {jitter:.0f}s")
+            await asyncio.sleep(jitter)
+
+            if not await self._query() or query_only:
+                return
+            to_compensate = self._get_to_compensate()
+            if to_compensate is None or to_compensate <= 0:
+                _LOGGER.debug(f"Nothing to compensate: {to_compensate}")
+                return
+            if to_compensate < self._min_batch_kwh:
+                _LOGGER.debug(f"{to_compensate} kWh is below minimum batch of {self._min_batch_kwh} kWh, skipping")
+                return
+            await self._compensate()
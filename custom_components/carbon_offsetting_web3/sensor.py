@@ -4,8 +4,9 @@ import logging
 
 from homeassistant.components.sensor import SensorEntity, SensorEntityDescription, SensorStateClass
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.const import DEVICE_CLASS_ENERGY, ENERGY_KILO_WATT_HOUR
+from homeassistant.const import DEVICE_CLASS_ENERGY, ENERGY_KILO_WATT_HOUR, PERCENTAGE, TIME_SECONDS
 from homeassistant.core import HomeAssistant
+from homeassistant.helpers.entity import EntityCategory
 
 from .const import DOMAIN
 
@@ -22,8 +23,17 @@ async def async_setup_entry(hass: HomeAssistant, config_entry: ConfigEntry, asyn
 
     """
     _LOGGER.debug("Start sensors setup")
-    client = hass.data[DOMAIN][config_entry.entry_id]
-    new_devices = [ToCompensate(client), LastCompensationDate(client), TotalCompensated(client)]
+    client = hass.data[DOMAIN][config_entry.entry_id]["client"]
+    new_devices = [
+        ToCompensate(client),
+        LastCompensationDate(client),
+        TotalCompensated(client),
+        CompensationRate(client),
+        AverageRtt(client),
+    ]
+    # The queue is shared by all the households, its sensor is only added with the first of them set up.
+    if hass.data[DOMAIN].setdefault("pubsub_queue_entry", config_entry.entry_id) == config_entry.entry_id:
+        new_devices.append(PubSubQueue(client, hass.data[DOMAIN]["dispatcher"]))
     if new_devices:
         async_add_entities(new_devices)
 
@@ -172,3 +182,122 @@ class TotalCompensated(SensorBase):
         """Return the state of the sensor."""
 
         return self._client.total_compensated
+
+
+class CompensationRate(SensorBase):
+    """
+    Sensor representing share of the energy consumed recently that got compensated.
+    """
+
+    def __init__(self, client):
+        """
+        Initialize the sensor.
+
+        :param client: Client device, defined in ``client.py``
+
+        """
+        super().__init__(client)
+        _LOGGER.debug(f"Initiating CompensationRate")
+
+        self._attr_unique_id = f"{self._client.client_id}_compensation_rate"
+
+        # The name of the entity
+        self._attr_name = f"Compensation rate"
+        self.entity_description = SensorEntityDescription(
+            key="compensation_rate",
+            name=self._attr_name,
+            native_unit_of_measurement=PERCENTAGE,
+            state_class=SensorStateClass.MEASUREMENT,
+            icon="mdi:leaf-circle-outline",
+        )
+
+    @property
+    def state(self):
+        """Return the state of the sensor."""
+
+        return self._client.compensation_rate
+
+    @property
+    def extra_state_attributes(self):
+        """Return the amount of samples the rate is computed over."""
+
+        return {"samples": len(self._client.history)}
+
+
+class AverageRtt(SensorBase):
+    """
+    Diagnostic sensor representing average agent response time over the recent queries and compensations.
+    """
+
+    def __init__(self, client):
+        """
+        Initialize the sensor.
+
+        :param client: Client device, defined in ``client.py``
+
+        """
+        super().__init__(client)
+        _LOGGER.debug(f"Initiating AverageRtt")
+
+        self._attr_unique_id = f"{self._client.client_id}_average_rtt"
+
+        # The name of the entity
+        self._attr_name = f"Average response time"
+        self._attr_entity_category = EntityCategory.DIAGNOSTIC
+        self.entity_description = SensorEntityDescription(
+            key="average_rtt",
+            name=self._attr_name,
+            native_unit_of_measurement=TIME_SECONDS,
+            state_class=SensorStateClass.MEASUREMENT,
+            icon="mdi:timer-outline",
+        )
+
+    @property
+    def state(self):
+        """Return the state of the sensor."""
+
+        return self._client.average_rtt
+
+
+class PubSubQueue(SensorBase):
+    """
+    Diagnostic sensor representing incoming PubSub messages queue depth, drop and pre-filter counters.
+    """
+
+    should_poll = True
+
+    def __init__(self, client, dispatcher):
+        """
+        Initialize the sensor.
+
+        :param client: Client device, defined in ``client.py``
+        :param dispatcher: Response dispatcher, defined in ``utils/dispatcher.py``
+
+        """
+        super().__init__(client)
+        _LOGGER.debug(f"Initiating PubSubQueue")
+
+        self._dispatcher = dispatcher
+        self._attr_unique_id = f"{self._client.client_id}_pubsub_queue"
+
+        # The name of the entity
+        self._attr_name = f"PubSub queue depth"
+        self._attr_entity_category = EntityCategory.DIAGNOSTIC
+        self.entity_description = SensorEntityDescription(
+            key="pubsub_queue",
+            name=self._attr_name,
+            state_class=SensorStateClass.MEASUREMENT,
+            icon="mdi:tray-full",
+        )
+
+    @property
+    def state(self):
+        """Return the state of the sensor."""
+
+        return self._dispatcher.stats["queue_depth"]
+
+    @property
+    def extra_state_attributes(self):
+        """Return drop and pre-filter counters."""
+
+        return self._dispatcher.stats
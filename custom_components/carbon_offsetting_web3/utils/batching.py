@@ -0,0 +1,108 @@
+"""Batching of PubSub queries of many householders into single publishes."""
+
+import asyncio
+import logging
+import typing as tp
+
+_LOGGER = logging.getLogger(__name__)
+
+BATCH_KEY = "batch"
+
+
+class BatchPublisher:
+    """
+    Collects messages per topic and publishes them as one ``{'batch': [...]}`` envelope when the batch is full or the
+        linger time passed. A batch of one message is published as is, so batch size 1 is plain per-message sending
+        for agents not supporting batches.
+
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        publish: tp.Callable[[str, tp.Any], tp.Awaitable[None]],
+        max_batch_size: int,
+        linger: float,
+    ) -> None:
+        """
+        Class init function, sets all class attributes.
+
+        :param loop: Event loop to run flushes in.
+        :param publish: Coroutine function to publish a message or an envelope with.
+        :param max_batch_size: Maximum amount of messages in a batch.
+        :param linger: Time to wait for more messages before publishing an incomplete batch, s.
+
+        """
+
+        self._loop = loop
+        self._publish = publish
+        self._max_batch_size = max_batch_size
+        self._linger = linger
+        self._pending: tp.Dict[str, tp.List[tp.Tuple[dict, asyncio.Future]]] = {}
+        self._timers: tp.Dict[str, asyncio.TimerHandle] = {}
+
+    def stop(self) -> None:
+        """Drop the batches not published yet, their senders get cancelled."""
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        for batch in self._pending.values():
+            for _, published in batch:
+                published.cancel()
+        self._pending.clear()
+
+    async def send(self, topic: str, message: dict) -> None:
+        """
+        Add a message to the topic batch and wait until the batch is published.
+
+        :param topic: Topic to send to.
+        :param message: Message to send.
+
+        """
+
+        published = self._loop.create_future()
+        self._pending.setdefault(topic, []).append((message, published))
+        if len(self._pending[topic]) >= self._max_batch_size:
+            self._flush(topic)
+        elif topic not in self._timers:
+            self._timers[topic] = self._loop.call_later(self._linger, self._flush, topic)
+        await published
+
+    def _flush(self, topic: str) -> None:
+        """
+        Publish the topic batch in background.
+
+        :param topic: Topic to publish the batch to.
+
+        """
+
+        timer = self._timers.pop(topic, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(topic, [])
+        if batch:
+            self._loop.create_task(self._publish_batch(topic, batch))
+
+    async def _publish_batch(self, topic: str, batch: tp.List[tp.Tuple[dict, asyncio.Future]]) -> None:
+        """
+        Publish a batch and report the result to the senders.
+
+        :param topic: Topic to publish the batch to.
+        :param batch: Messages with their senders futures.
+
+        """
+
+        try:
+            if len(batch) == 1:
+                await self._publish(topic, batch[0][0])
+            else:
+                _LOGGER.debug(f"Publishing batch of {len(batch)} messages to {topic}")
+                await self._publish(topic, {BATCH_KEY: [message for message, _ in batch]})
+        except Exception as e:
+            for _, published in batch:
+                if not published.done():
+                    published.set_exception(e)
+        else:
+            for _, published in batch:
+                if not published.done():
+                    published.set_result(None)
@@ -0,0 +1,288 @@
+"""Handoff of raw PubSub frames from subscription threads to the event loop."""
+
+import asyncio
+import logging
+import threading
+import typing as tp
+from collections import deque
+from time import monotonic
+
+from ..const import OVERFLOW_DROP_FOREIGN_FIRST
+from .batching import BATCH_KEY
+from .pubsub import AddressFilter, parse_income_message
+
+_LOGGER = logging.getLogger(__name__)
+
+ResponseHandler = tp.Callable[[dict], tp.Awaitable[None]]
+
+
+class FrameQueue:
+    """Bounded thread-safe queue of raw PubSub frames, put from subscription threads and got in the event loop."""
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        maxsize: int,
+        overflow_policy: str,
+        is_foreign: tp.Callable[[bytes], bool],
+    ) -> None:
+        """
+        Class init function, sets all class attributes.
+
+        :param loop: Event loop the frames are consumed in.
+        :param maxsize: Maximum amount of frames waiting for processing.
+        :param overflow_policy: Which frame to drop when full, ``OVERFLOW_DROP_OLDEST`` or
+            ``OVERFLOW_DROP_FOREIGN_FIRST``.
+        :param is_foreign: Function telling whether a raw frame is addressed to someone else.
+
+        """
+
+        self._loop = loop
+        self._maxsize = maxsize
+        self._overflow_policy = overflow_policy
+        self._is_foreign = is_foreign
+        self._frames: tp.Deque[tp.Tuple[str, bytes, float]] = deque()
+        self._lock = threading.Lock()
+        self._not_empty = asyncio.Event()
+
+        self.dropped_oldest = 0
+        self.dropped_foreign = 0
+
+    @property
+    def depth(self) -> int:
+        """
+        Amount of frames waiting for processing.
+
+        """
+
+        return len(self._frames)
+
+    def put_threadsafe(self, topic: str, frame: bytes) -> None:
+        """
+        Enqueue a raw frame, dropping one according to the overflow policy if the queue is full. Safe to call from any
+            thread.
+
+        :param topic: Topic the frame came from.
+        :param frame: Raw PubSub frame.
+
+        """
+
+        with self._lock:
+            if len(self._frames) >= self._maxsize:
+                self._drop()
+            self._frames.append((topic, frame, monotonic()))
+        self._loop.call_soon_threadsafe(self._not_empty.set)
+
+    def _drop(self) -> None:
+        """
+        Drop one frame to free space for a new one. Must be called under the lock.
+
+        """
+
+        if self._overflow_policy == OVERFLOW_DROP_FOREIGN_FIRST:
+            for i, (_, frame, _) in enumerate(self._frames):
+                if self._is_foreign(frame):
+                    del self._frames[i]
+                    self.dropped_foreign += 1
+                    return
+        self._frames.popleft()
+        self.dropped_oldest += 1
+
+    async def get(self) -> tp.Tuple[str, bytes, float]:
+        """
+        Wait for the next frame.
+
+        :return: Topic, raw frame and monotonic time it was enqueued at.
+
+        """
+
+        while True:
+            with self._lock:
+                if self._frames:
+                    return self._frames.popleft()
+                self._not_empty.clear()
+            await self._not_empty.wait()
+
+
+class ResponseDispatcher:
+    """
+    Event loop consumer of the frame queue. Pre-filters, decodes and routes responses to the handlers waiting on their
+        topic and householder address.
+
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        address_filter: AddressFilter,
+        maxsize: int,
+        overflow_policy: str,
+        record: tp.Optional[tp.Callable[[str, bytes], None]] = None,
+    ) -> None:
+        """
+        Class init function, sets all class attributes.
+
+        :param loop: Event loop to consume frames in.
+        :param address_filter: Pre-filter for frames addressed to other householders.
+        :param maxsize: Frame queue size.
+        :param overflow_policy: Frame queue overflow policy.
+        :param record: Function to record raw frames with as they come, called in the subscription threads.
+
+        """
+
+        self._loop = loop
+        self._address_filter = address_filter
+        self._queue = FrameQueue(loop, maxsize, overflow_policy, address_filter.is_foreign)
+        # Several queries of one householder may overlap, e.g. a manual one and a scheduled one, all of them get the
+        # outcome of the response applied once.
+        self._handlers: tp.Dict[tp.Tuple[str, str], tp.List[tp.Tuple[ResponseHandler, asyncio.Future]]] = {}
+        self._consumer: tp.Optional[asyncio.Task] = None
+        self._record = record
+
+        self.processed = 0
+        # Called with the time each frame spent from enqueueing to the end of its processing, s.
+        self.latency_sink: tp.Optional[tp.Callable[[float], None]] = None
+
+    @property
+    def stats(self) -> tp.Dict[str, int]:
+        """
+        Queue depth, drop counters and pre-filter counters.
+
+        """
+
+        return dict(
+            queue_depth=self._queue.depth,
+            dropped_oldest=self._queue.dropped_oldest,
+            dropped_foreign=self._queue.dropped_foreign,
+            processed=self.processed,
+            matched=self._address_filter.matched,
+            skipped=self._address_filter.skipped,
+        )
+
+    def start(self) -> None:
+        """Start consuming frames."""
+        self._consumer = self._loop.create_task(self._consume())
+
+    async def stop(self) -> None:
+        """Stop consuming frames."""
+        if self._consumer is not None:
+            self._consumer.cancel()
+            try:
+                await self._consumer
+            except asyncio.CancelledError:
+                pass
+            self._consumer = None
+
+    def enqueue(self, topic: str, frame: bytes) -> None:
+        """
+        Hand a raw frame over to the event loop. Safe to call from any thread.
+
+        :param topic: Topic the frame came from.
+        :param frame: Raw PubSub frame.
+
+        """
+
+        if self._record is not None:
+            self._record(topic, frame)
+        self._queue.put_threadsafe(topic, frame)
+
+    async def _consume(self) -> None:
+        """
+        Decode queued frames and apply them with the handler waiting on their topic and address. A frame failing to
+            process is logged and skipped, the consumer is shared by all the householders and must keep running.
+
+        """
+
+        while True:
+            topic, frame, enqueued_at = await self._queue.get()
+            try:
+                await self._process(topic, frame)
+            except Exception as e:
+                _LOGGER.warning(f"Failed to process message in {topic}: {e!r}")
+            finally:
+                self.processed += 1
+                if self.latency_sink is not None:
+                    self.latency_sink(monotonic() - enqueued_at)
+
+    async def _process(self, topic: str, frame: bytes) -> None:
+        """
+        Pre-filter and decode a frame and route the response or each item of a batch of them.
+
+        :param topic: Topic the frame came from.
+        :param frame: Raw PubSub frame.
+
+        """
+
+        if not self._address_filter.matches(frame):
+            return
+        try:
+            response = parse_income_message(frame)
+        except Exception as e:
+            _LOGGER.warning(f"Failed to decode message in {topic}: {e}")
+            return
+        # Anyone may publish to the response topics, anything but a response dict is skipped.
+        if not isinstance(response, dict):
+            _LOGGER.debug(f"Skipped non-dict message in {topic}")
+            return
+        if BATCH_KEY in response:
+            batch = response[BATCH_KEY]
+            for item in batch if isinstance(batch, list) else ():
+                if isinstance(item, dict):
+                    await self._route(topic, item)
+        else:
+            await self._route(topic, response)
+
+    async def _route(self, topic: str, response: dict) -> None:
+        """
+        Apply a decoded response, or an item of a batch of them, once with the first handler still waiting on its topic
+            and address, if any, and resolve all the waiters with the outcome.
+
+        :param topic: Topic the response came from.
+        :param response: Decoded response message.
+
+        """
+
+        key = (topic, response.get("address"))
+        entries = [(handler, waiter) for handler, waiter in self._handlers.get(key, ()) if not waiter.done()]
+        if not entries:
+            return
+        # Overlapping queries share the response, applying it per waiter would record and notify it several times.
+        handler = entries[0][0]
+        try:
+            await handler(response)
+            error = None
+        except Exception as e:
+            error = e
+        # Waiters may have timed out or been cancelled while the handler ran. Ones come meanwhile wait for a newer query
+        # response.
+        for _, waiter in entries:
+            if waiter.done():
+                continue
+            if error is None:
+                waiter.set_result(True)
+            else:
+                waiter.set_exception(error)
+
+    async def wait_response(
+        self, response_topic: str, address: str, handler: ResponseHandler, timeout: tp.Optional[float]
+    ) -> None:
+        """
+        Wait for a householder response in a topic and apply it with the handler.
+
+        :param response_topic: Topic in PubSub the response comes to.
+        :param address: Householder address in Robonomics Parachain.
+        :param handler: Coroutine function to apply the decoded response with.
+        :param timeout: Timeout to stop waiting if no response got via PubSub. None to wait until cancelled.
+
+        """
+
+        key = (response_topic, address)
+        waiter = self._loop.create_future()
+        entry = (handler, waiter)
+        self._handlers.setdefault(key, []).append(entry)
+        try:
+            await asyncio.wait_for(waiter, timeout=timeout)
+        finally:
+            self._handlers[key].remove(entry)
+            if not self._handlers[key]:
+                del self._handlers[key]
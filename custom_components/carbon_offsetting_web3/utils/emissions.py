@@ -0,0 +1,304 @@
+"""Hourly time-weighted emissions over recorder long-term statistics."""
+
+import logging
+import typing as tp
+from datetime import date, timedelta
+
+import homeassistant.util.dt as dt_util
+import numpy as np
+from homeassistant.components.recorder import get_instance
+from homeassistant.components.recorder.statistics import statistics_during_period
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+
+from ..const import (
+    DOMAIN,
+    EMISSIONS_INITIAL_HOURS,
+    EMISSIONS_MAX_HOURS,
+    EMISSIONS_SETTLE_HOURS,
+    EMISSIONS_STORAGE_VERSION,
+    TECHNICS_DETAIL_HOURLY,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+HOUR = 3600
+DAY = 24 * HOUR
+# UTC offset changes are months apart, a span with the same offset at both ends is taken as constant if not longer.
+_OFFSET_SPAN_HOURS = 24 * 7
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def emissions_storage_key(address: str) -> str:
+    """
+    Key of HomeAssistant storage processed hours of a householder are cached in.
+
+    :param address: Householder address in Robonomics Parachain.
+
+    :return: Storage key.
+
+    """
+
+    return f"{DOMAIN}.emissions_{address}"
+
+
+async def async_remove_emissions(hass: HomeAssistant, address: str) -> None:
+    """
+    Remove processed hours cached for a householder.
+
+    :param hass: HomeAssistant instance.
+    :param address: Householder address in Robonomics Parachain.
+
+    """
+
+    await Store(hass, EMISSIONS_STORAGE_VERSION, emissions_storage_key(address)).async_remove()
+
+
+def local_timestamps(first: float, hours: int) -> np.ndarray:
+    """
+    Local wall-clock time of consecutive hours as seconds since the epoch, so local hours and days are plain integer
+        divisions. The UTC offset is looked up at the ends of spans and spans are only split where it differs, so a
+        year of hours takes under a hundred lookups instead of one per hour.
+
+    :param first: Timestamp of the first hour start.
+    :param hours: Amount of hours.
+
+    :return: Local times of the hours starts.
+
+    """
+
+    offsets = np.empty(hours, dtype=np.float64)
+
+    def offset(i: int) -> float:
+        """UTC offset at the start of hour ``i``, s."""
+        return dt_util.as_local(dt_util.utc_from_timestamp(first + i * HOUR)).utcoffset().total_seconds()
+
+    def fill(lo: int, hi: int, lo_offset: float, hi_offset: float) -> None:
+        """Fill offsets of hours ``lo`` to ``hi`` inclusive knowing the offsets at both ends."""
+        if lo_offset == hi_offset and hi - lo < _OFFSET_SPAN_HOURS:
+            offsets[lo : hi + 1] = lo_offset
+        elif hi - lo <= 1:
+            offsets[lo] = lo_offset
+            offsets[hi] = hi_offset
+        else:
+            mid = (lo + hi) // 2
+            mid_offset = offset(mid)
+            fill(lo, mid, lo_offset, mid_offset)
+            fill(mid, hi, mid_offset, hi_offset)
+
+    if hours:
+        fill(0, hours - 1, offset(0), offset(hours - 1))
+    return first + np.arange(hours) * HOUR + offsets
+
+
+def parse_intensity_profile(raw: str) -> tp.List[float]:
+    """
+    Parse a grid carbon intensity profile, gCO2/kWh. Either one value for all the day or 24 comma-separated values
+        for each local hour starting from midnight.
+
+    :param raw: Profile as entered in the configuration form.
+
+    :return: 24 hourly values.
+
+    """
+
+    values = [float(value) for value in raw.replace("\n", ",").split(",") if value.strip()]
+    if len(values) == 1:
+        values *= 24
+    if len(values) != 24:
+        raise ValueError(f"Expected 1 or 24 carbon intensity values, got {len(values)}")
+    if any(value < 0 for value in values):
+        raise ValueError("Carbon intensity can't be negative")
+    return values
+
+
+class EmissionsEngine:
+    """
+    Net energy and emissions per hour since the last compensation, or for the last ``EMISSIONS_INITIAL_HOURS`` before
+        the first one. Hourly changes of the energy entities are pulled from the recorder long-term statistics in bulk,
+        weighted with the carbon intensity of the hour and cached, so each update only processes the hours completed
+        since the previous one.
+
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        consumption_entities: tp.List[str],
+        production_entities: tp.List[str],
+        intensity_profile: tp.List[float],
+        storage_key: str,
+    ) -> None:
+        """
+        Class init function, sets all class attributes.
+
+        :param hass: HomeAssistant instance.
+        :param consumption_entities: Energy entities representing total devices' consumption.
+        :param production_entities: Energy entities representing total energy production.
+        :param intensity_profile: Grid carbon intensity for each local hour, gCO2/kWh.
+        :param storage_key: Key of HomeAssistant storage to cache processed hours in.
+
+        """
+
+        self._hass = hass
+        self._signs = {entity: 1.0 for entity in consumption_entities}
+        self._signs.update({entity: -1.0 for entity in production_entities})
+        self._intensity_profile = np.asarray(intensity_profile, dtype=np.float64)
+        self._store = Store(hass, EMISSIONS_STORAGE_VERSION, storage_key)
+
+        # Hour ``i`` of the arrays starts at ``self._start + i * HOUR``.
+        self._start: tp.Optional[float] = None
+        self._net_kwh = np.zeros(0)
+        self._emissions_g = np.zeros(0)
+
+    @property
+    def _end(self) -> tp.Optional[float]:
+        """
+        Timestamp the processed hours end at.
+
+        """
+
+        return None if self._start is None else self._start + len(self._net_kwh) * HOUR
+
+    async def async_load(self) -> None:
+        """Load hours processed by previous runs."""
+        data = await self._store.async_load()
+        if data:
+            self._start = data["start"]
+            self._net_kwh = np.asarray(data["net_kwh"], dtype=np.float64)
+            self._emissions_g = np.asarray(data["emissions_g"], dtype=np.float64)
+        _LOGGER.debug(f"Loaded {len(self._net_kwh)} processed hours")
+
+    def _data_to_save(self) -> tp.Dict[str, tp.Any]:
+        """Processed hours in a JSON-serializable form."""
+        return dict(start=self._start, net_kwh=self._net_kwh.tolist(), emissions_g=self._emissions_g.tolist())
+
+    async def async_update(self) -> None:
+        """Process the hours completed since the previous update."""
+        end = dt_util.utcnow().replace(minute=0, second=0, microsecond=0) - timedelta(hours=EMISSIONS_SETTLE_HOURS)
+        start = (
+            end - timedelta(hours=EMISSIONS_INITIAL_HOURS)
+            if self._start is None
+            else dt_util.utc_from_timestamp(self._end)
+        )
+        if start >= end:
+            return
+
+        stats = await get_instance(self._hass).async_add_executor_job(
+            statistics_during_period,
+            self._hass,
+            start,
+            end,
+            set(self._signs),
+            "hour",
+            {"energy": "kWh"},
+            {"change"},
+        )
+
+        hours = int((end - start).total_seconds()) // HOUR
+        first = start.timestamp()
+        net_kwh = np.zeros(hours)
+        for entity, rows in stats.items():
+            starts = np.fromiter((_row_timestamp(row) for row in rows), dtype=np.float64, count=len(rows))
+            changes = np.fromiter((row.get("change") or 0.0 for row in rows), dtype=np.float64, count=len(rows))
+            indices = ((starts - first) // HOUR).astype(np.int64)
+            valid = (indices >= 0) & (indices < hours)
+            np.add.at(net_kwh, indices[valid], self._signs[entity] * changes[valid])
+
+        local_hours = (local_timestamps(first, hours) // HOUR % 24).astype(np.int64)
+        # Exported energy doesn't make emissions negative, it is already accounted for in the net kWh.
+        emissions_g = np.clip(net_kwh, 0, None) * self._intensity_profile[local_hours]
+
+        self._net_kwh = np.concatenate((self._net_kwh, net_kwh))[-EMISSIONS_MAX_HOURS:]
+        self._emissions_g = np.concatenate((self._emissions_g, emissions_g))[-EMISSIONS_MAX_HOURS:]
+        self._start = end.timestamp() - len(self._net_kwh) * HOUR
+        _LOGGER.debug(f"Processed {hours} hours of statistics: {net_kwh.sum():.3f} kWh, {emissions_g.sum():.0f} g")
+        await self._store.async_save(self._data_to_save())
+
+    def summary(self) -> tp.Optional[tp.Dict[str, tp.Any]]:
+        """
+        Emissions of the hours processed since the last compensation, to attach to the liability technics.
+
+        :return: Period, net kWh, emissions and average carbon intensity, or None if no hours processed.
+
+        """
+
+        if not len(self._net_kwh):
+            return None
+        net_kwh = float(self._net_kwh.sum())
+        emissions_g = float(self._emissions_g.sum())
+        consumed_kwh = float(np.clip(self._net_kwh, 0, None).sum())
+        return dict(
+            start=dt_util.utc_from_timestamp(self._start).isoformat(),
+            end=dt_util.utc_from_timestamp(self._end).isoformat(),
+            hours=len(self._net_kwh),
+            net_kwh=round(net_kwh, 3),
+            co2_kg=round(emissions_g / 1000, 3),
+            intensity_g_per_kwh=round(emissions_g / consumed_kwh, 1) if consumed_kwh else None,
+        )
+
+    def breakdown(self, granularity: str) -> tp.Optional[tp.Dict[str, tp.Any]]:
+        """
+        Net energy and emissions of the hours processed since the last compensation, per hour or per local day. Values
+            are stored as columns, so a month of hours stays a few kilobytes.
+
+        :param granularity: ``TECHNICS_DETAIL_HOURLY`` or ``TECHNICS_DETAIL_DAILY``.
+
+        :return: Periods with their net kWh and emissions in g, or None if no hours processed.
+
+        """
+
+        if not len(self._net_kwh):
+            return None
+        if granularity == TECHNICS_DETAIL_HOURLY:
+            return dict(
+                step="hour",
+                start=dt_util.utc_from_timestamp(self._start).isoformat(),
+                net_kwh=np.round(self._net_kwh, 3).tolist(),
+                co2_g=np.round(self._emissions_g, 1).tolist(),
+            )
+
+        days = (local_timestamps(self._start, len(self._net_kwh)) // DAY).astype(np.int64) + _EPOCH_ORDINAL
+        unique_days, day_indices = np.unique(days, return_inverse=True)
+        net_kwh = np.zeros(len(unique_days))
+        emissions_g = np.zeros(len(unique_days))
+        np.add.at(net_kwh, day_indices, self._net_kwh)
+        np.add.at(emissions_g, day_indices, self._emissions_g)
+        return dict(
+            step="day",
+            days=[date.fromordinal(int(day)).isoformat() for day in unique_days],
+            net_kwh=np.round(net_kwh, 3).tolist(),
+            co2_g=np.round(emissions_g, 1).tolist(),
+        )
+
+    async def async_mark_compensated(self, until: str) -> None:
+        """
+        Drop the hours covered by a successful compensation.
+
+        :param until: ``end`` of the compensated summary.
+
+        """
+
+        if self._start is None:
+            return
+        covered = int(dt_util.parse_datetime(until).timestamp() - self._start) // HOUR
+        if covered <= 0:
+            return
+        self._net_kwh = self._net_kwh[covered:]
+        self._emissions_g = self._emissions_g[covered:]
+        self._start += covered * HOUR
+        await self._store.async_save(self._data_to_save())
+
+
+def _row_timestamp(row: tp.Mapping[str, tp.Any]) -> float:
+    """
+    Statistics row start as a timestamp. Older HomeAssistant versions return datetimes.
+
+    :param row: Statistics row.
+
+    :return: Row start timestamp.
+
+    """
+
+    start = row["start"]
+    return start if isinstance(start, (int, float)) else start.timestamp()
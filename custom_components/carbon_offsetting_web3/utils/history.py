@@ -0,0 +1,138 @@
+"""Fixed-capacity history of the recent query and compensation samples with incrementally maintained statistics."""
+
+import logging
+import typing as tp
+from time import time
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class Sample:
+    """One query or compensation outcome."""
+
+    __slots__ = ("timestamp", "net_kwh", "compensated_kwh", "rtt")
+
+    def __init__(self) -> None:
+        """
+        Class init function, sets all class attributes.
+
+        """
+
+        self.timestamp = 0.0
+        self.net_kwh = 0.0
+        self.compensated_kwh = 0.0
+        self.rtt: tp.Optional[float] = None
+
+    def __repr__(self) -> str:
+        """Sample fields for logging."""
+        return (
+            f"Sample(timestamp={self.timestamp}, net_kwh={self.net_kwh}, "
+            f"compensated_kwh={self.compensated_kwh}, rtt={self.rtt})"
+        )
+
+
+class SampleHistory:
+    """
+    Ring buffer over a preallocated list of ``Sample`` records, overwritten in place once full. Sums needed by the
+        statistics are updated as samples come and go, so each update and each statistic is O(1) whatever the capacity.
+
+    """
+
+    def __init__(self, capacity: int) -> None:
+        """
+        Class init function, sets all class attributes.
+
+        :param capacity: Maximum amount of samples kept.
+
+        """
+
+        self._samples = [Sample() for _ in range(capacity)]
+        self._next = 0
+        self._count = 0
+        self._rtt_sum = 0.0
+        self._rtt_count = 0
+
+    def __len__(self) -> int:
+        """Amount of samples kept."""
+        return self._count
+
+    def __iter__(self) -> tp.Iterator[Sample]:
+        """Samples from the oldest to the newest."""
+        capacity = len(self._samples)
+        for i in range(self._count):
+            yield self._samples[(self._next - self._count + i) % capacity]
+
+    @property
+    def oldest(self) -> tp.Optional[Sample]:
+        """
+        Oldest sample kept, None if empty.
+
+        """
+
+        return self._samples[(self._next - self._count) % len(self._samples)] if self._count else None
+
+    @property
+    def newest(self) -> tp.Optional[Sample]:
+        """
+        Newest sample, None if empty.
+
+        """
+
+        return self._samples[self._next - 1] if self._count else None
+
+    def add(self, net_kwh: float, compensated_kwh: float, rtt: tp.Optional[float] = None) -> None:
+        """
+        Add a sample, evicting the oldest one if full.
+
+        :param net_kwh: Net kWh consumed in total, consumption subtracted with production.
+        :param compensated_kwh: kWh compensated in total.
+        :param rtt: Response round-trip time, s. None if not measured, e.g. for a resent query.
+
+        """
+
+        sample = self._samples[self._next]
+        if self._count == len(self._samples):
+            if sample.rtt is not None:
+                self._rtt_sum -= sample.rtt
+                self._rtt_count -= 1
+                if not self._rtt_count:
+                    # Drop the rounding error accumulated by the subtractions.
+                    self._rtt_sum = 0.0
+        else:
+            self._count += 1
+        sample.timestamp = time()
+        sample.net_kwh = net_kwh
+        sample.compensated_kwh = compensated_kwh
+        sample.rtt = rtt
+        if rtt is not None:
+            self._rtt_sum += rtt
+            self._rtt_count += 1
+        self._next = (self._next + 1) % len(self._samples)
+        _LOGGER.debug(f"History sample added: {sample}")
+
+    @property
+    def compensation_rate(self) -> tp.Optional[float]:
+        """
+        Share of the net energy consumed over the kept samples that got compensated in the meantime, %. May exceed
+            100% when an older backlog is compensated.
+
+        """
+
+        if self._count < 2:
+            return None
+        oldest, newest = self.oldest, self.newest
+        consumed = newest.net_kwh - oldest.net_kwh
+        if consumed <= 0:
+            return None
+        return round((newest.compensated_kwh - oldest.compensated_kwh) / consumed * 100, 1)
+
+    @property
+    def average_rtt(self) -> tp.Optional[float]:
+        """
+        Average response round-trip time over the kept samples, s. None if none measured.
+
+        """
+
+        if not self._rtt_count:
+            return None
+        return round(self._rtt_sum / self._rtt_count, 3)
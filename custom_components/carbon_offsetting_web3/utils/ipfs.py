@@ -0,0 +1,263 @@
+"""IPFS gateways handling: auth headers, extra gateways parsing and concurrent pinning."""
+
+import asyncio
+import logging
+import typing as tp
+
+import ipfshttpclient2
+from robonomicsinterface import web_3_auth
+
+from ..const import (
+    CONF_ADMIN_SEED,
+    CONF_IPFS_EXTRA_GWS,
+    CONF_IPFS_GATEWAY_AUTH,
+    CONF_IPFS_GATEWAY_PWD,
+    CONF_IPFS_GW,
+    CONF_IPFS_GW_RANKING,
+    CONF_IS_W3GW,
+    IPFS_AUTH_LOGIN,
+    IPFS_AUTH_NONE,
+    IPFS_AUTH_W3,
+    IPFS_GW,
+)
+from .thread_wrapper import to_thread
+
+_LOGGER = logging.getLogger(__name__)
+
+IPFSGateway = tp.Tuple[str, tp.Callable[[], tuple]]
+# Runs a coroutine in background and returns its task, e.g. ``ResourceRegistry.track``.
+BackgroundRunner = tp.Callable[[tp.Coroutine, str], asyncio.Task]
+
+# Strong references to background tasks started without a runner, for them not to be garbage-collected while running.
+_background_tasks: tp.Set[asyncio.Task] = set()
+
+
+def _run_in_background(coro: tp.Coroutine, description: str) -> asyncio.Task:
+    """
+    Default background runner: keeps a reference to the task until it is done.
+
+    :param coro: Coroutine.
+    :param description: Task name.
+
+    :return: Task.
+
+    """
+
+    task = asyncio.get_running_loop().create_task(coro, name=description)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+@to_thread
+def ipfs_client_thread_wrapper(ipfs_gw: str, ipfs_auth: tuple, content: dict) -> str:
+    """
+    Wrapped IPFS 'Add JSON' functionality to be used in async methods. Uploads any dict (JSON) to IPFS.
+
+    :param ipfs_gw: IPFS gateway to upload through.
+    :param ipfs_auth: Gateway auth header (login, password).
+    :param content: Content to upload.
+
+    :return: IPFS CID.
+
+    """
+    with ipfshttpclient2.connect(addr=ipfs_gw, auth=ipfs_auth) as client:
+        return client.add_json(content)
+
+
+def get_ipfs_auth_wrapper(
+    auth_mode: str, seed: tp.Optional[str] = None, login: tp.Optional[str] = None, pwd: tp.Optional[str] = None
+) -> tp.Callable[[], tuple]:
+    """
+    Get a function returning fresh auth header for an IPFS gateway.
+
+    :param auth_mode: One of ``IPFS_AUTH_W3``, ``IPFS_AUTH_LOGIN``, ``IPFS_AUTH_NONE``.
+    :param seed: Account seed to form web3-auth header with.
+    :param login: Gateway auth login.
+    :param pwd: Gateway auth password.
+
+    :return: Auth header getter.
+
+    """
+
+    if auth_mode == IPFS_AUTH_W3:
+
+        def ipfs_w3gw_auth_wrapper():
+            """
+            Gateway wrapper to get fresh web3_auth header.
+
+            :return: web3_auth header.
+            """
+            return web_3_auth(seed)
+
+        return ipfs_w3gw_auth_wrapper
+
+    if auth_mode == IPFS_AUTH_LOGIN:
+
+        def ipfs_auth_wrapper():
+            """
+            Gateway wrapper to get auth header.
+
+            :return: Auth header.
+            """
+            return login, pwd
+
+        return ipfs_auth_wrapper
+
+    def ipfs_empty_auth_wrapper():
+        """
+        Gateway wrapper to get empty auth header.
+
+        :return: Empty header.
+        """
+        return ()
+
+    return ipfs_empty_auth_wrapper
+
+
+def parse_extra_ipfs_gateways(raw: str) -> tp.List[tp.Tuple[str, str, tp.Optional[str], tp.Optional[str]]]:
+    """
+    Parse extra IPFS gateways user input. Gateways are separated with commas or new lines, each one is a multiaddr
+        optionally followed by a space and either ``w3`` for web3-auth or ``login:password``.
+
+    :param raw: User input.
+
+    :return: List of (multiaddr, auth mode, login, password).
+
+    """
+
+    gateways = []
+    for line in raw.replace(",", "\n").splitlines():
+        parts = line.split()
+        if not parts:
+            continue
+        if len(parts) > 2 or not parts[0].startswith("/"):
+            raise ValueError(f"Malformed IPFS gateway specification: {line}")
+        if len(parts) == 1:
+            gateways.append((parts[0], IPFS_AUTH_NONE, None, None))
+        elif parts[1] == IPFS_AUTH_W3:
+            gateways.append((parts[0], IPFS_AUTH_W3, None, None))
+        else:
+            login, sep, pwd = parts[1].partition(":")
+            if not (sep and login and pwd):
+                raise ValueError(f"Malformed IPFS gateway credentials for {parts[0]}")
+            gateways.append((parts[0], IPFS_AUTH_LOGIN, login, pwd))
+
+    return gateways
+
+
+def get_ipfs_gateways(conf: tp.Mapping[str, tp.Any]) -> tp.List[IPFSGateway]:
+    """
+    Get the configured IPFS gateways with their auth header getters, fastest first if they were ranked.
+
+    :param conf: Entry config or user input.
+
+    :return: List of (gateway multiaddr, auth header getter).
+
+    """
+
+    ipfs_gw = conf.get(CONF_IPFS_GW, IPFS_GW)
+    _LOGGER.debug(f"Set ipfs_gw to {ipfs_gw}")
+
+    if CONF_IS_W3GW in conf:
+        ipfs_gw_auth = get_ipfs_auth_wrapper(IPFS_AUTH_W3, seed=conf[CONF_ADMIN_SEED])
+        _LOGGER.debug(f"Set ipfs_gw_auth to web3-auth format")
+    elif CONF_IPFS_GATEWAY_AUTH in conf:
+        ipfs_gw_auth = get_ipfs_auth_wrapper(
+            IPFS_AUTH_LOGIN, login=conf[CONF_IPFS_GATEWAY_AUTH], pwd=conf[CONF_IPFS_GATEWAY_PWD]
+        )
+        _LOGGER.debug(f"Set ipfs_gw_auth to login/password")
+    else:
+        ipfs_gw_auth = get_ipfs_auth_wrapper(IPFS_AUTH_NONE)
+        _LOGGER.debug(f"Set ipfs_gw_auth to empty")
+
+    ipfs_gateways = [(ipfs_gw, ipfs_gw_auth)]
+    for extra_gw, auth_mode, login, pwd in parse_extra_ipfs_gateways(conf.get(CONF_IPFS_EXTRA_GWS, "")):
+        ipfs_gateways.append(
+            (extra_gw, get_ipfs_auth_wrapper(auth_mode, seed=conf[CONF_ADMIN_SEED], login=login, pwd=pwd))
+        )
+        _LOGGER.debug(f"Added extra IPFS gateway {extra_gw} with {auth_mode} auth")
+
+    ranking = conf.get(CONF_IPFS_GW_RANKING, [])
+    ipfs_gateways.sort(key=lambda gateway: ranking.index(gateway[0]) if gateway[0] in ranking else len(ranking))
+    return ipfs_gateways
+
+
+async def pin_to_gateways(
+    ipfs_gateways: tp.List[IPFSGateway], content: dict, run_in_background: tp.Optional[BackgroundRunner] = None
+) -> str:
+    """
+    Upload content to all the gateways concurrently. Returns as soon as the first gateway returns a CID, the rest of
+        the pins are awaited and reported in background. If cancelled, all the uploads are cancelled.
+
+    :param ipfs_gateways: List of (gateway multiaddr, auth header getter).
+    :param content: Content to upload.
+    :param run_in_background: Function to run the report of the remaining pins with, e.g. one cancelling it on unload.
+        A task kept until done by default.
+
+    :return: IPFS CID of the first successful upload.
+
+    """
+
+    tasks = {
+        asyncio.ensure_future(ipfs_client_thread_wrapper(ipfs_gw, ipfs_auth(), content)): ipfs_gw
+        for ipfs_gw, ipfs_auth in ipfs_gateways
+    }
+    pending = set(tasks)
+    errors = []
+    cid = None
+    while pending and cid is None:
+        try:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            for task in tasks:
+                task.cancel()
+            raise
+        for task in done:
+            if task.exception() is not None:
+                _LOGGER.warning(f"Failed to pin technics to {tasks[task]}: {task.exception()}")
+                errors.append(task.exception())
+            elif cid is None:
+                cid = task.result()
+                _LOGGER.debug(f"Technics pinned to {tasks[task]} first, CID: {cid}")
+
+    if cid is None:
+        raise errors[0]
+
+    report = (run_in_background or _run_in_background)(
+        _report_remaining_pins(cid, tasks, pending), f"report pins of {cid}"
+    )
+
+    def cancel_pending(_: asyncio.Task) -> None:
+        """Cancel the uploads left if the report is cancelled, even before it started."""
+        for task in pending:
+            task.cancel()
+
+    report.add_done_callback(cancel_pending)
+    return cid
+
+
+async def _report_remaining_pins(cid: str, tasks: tp.Dict[asyncio.Future, str], pending: tp.Set[asyncio.Future]):
+    """
+    Wait for the rest of the gateways to pin the content and check all of them returned the same CID.
+
+    :param cid: CID returned by the first gateway.
+    :param tasks: All the upload tasks mapped to their gateways.
+    :param pending: Uploads still in progress.
+
+    """
+
+    if pending:
+        await asyncio.wait(pending)
+
+    pinned = 0
+    for task, ipfs_gw in tasks.items():
+        if task.exception() is not None:
+            if task in pending:
+                _LOGGER.warning(f"Failed to pin technics {cid} to {ipfs_gw}: {task.exception()}")
+            continue
+        if task.result() != cid:
+            _LOGGER.warning(f"CID mismatch: {ipfs_gw} returned {task.result()}, expected {cid}")
+            continue
+        pinned += 1
+    _LOGGER.debug(f"Technics {cid} pinned to {pinned}/{len(tasks)} gateways")
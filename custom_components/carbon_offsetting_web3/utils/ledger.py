@@ -0,0 +1,283 @@
+"""Local SQLite ledger of compensation queries, liabilities and reports."""
+
+import asyncio
+import logging
+import sqlite3
+import typing as tp
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+
+from ..const import LEDGER_FLUSH_INTERVAL, LEDGER_MAX_BATCH, LEDGER_MAX_BUFFER
+
+_LOGGER = logging.getLogger(__name__)
+
+KIND_QUERY = "query"
+KIND_LIABILITY = "liability"
+KIND_REPORT = "report"
+
+GROUP_BY_FORMATS = {"day": "%Y-%m-%d", "month": "%Y-%m", "year": "%Y"}
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS events (
+        id INTEGER PRIMARY KEY,
+        kind TEXT NOT NULL,
+        address TEXT NOT NULL,
+        ts REAL NOT NULL,
+        kwh REAL,
+        total REAL,
+        technics TEXT,
+        signature TEXT,
+        report TEXT,
+        success INTEGER
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS events_address_kind_ts ON events (address, kind, ts)",
+    "CREATE INDEX IF NOT EXISTS events_kind_ts ON events (kind, ts)",
+)
+_COLUMNS = ("kind", "address", "ts", "kwh", "total", "technics", "signature", "report", "success")
+
+
+class CompensationLedger:
+    """
+    Append-only ledger indexed by account and time. Records are buffered in memory and written in batches by a
+        dedicated thread, so the event loop never waits for the disk.
+
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, path: str) -> None:
+        """
+        Class init function, sets all class attributes.
+
+        :param loop: Event loop to schedule flushes in.
+        :param path: SQLite database file path.
+
+        """
+
+        self._loop = loop
+        self._path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="carbon_offsetting_ledger")
+        self._connection: tp.Optional[sqlite3.Connection] = None
+        self._buffer: tp.List[tuple] = []
+        self._flusher: tp.Optional[asyncio.Task] = None
+        self._full_flush: tp.Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+
+        self.dropped = 0
+
+    async def async_start(self) -> None:
+        """Open the database, create the schema and start periodic flushes."""
+        await self._loop.run_in_executor(self._executor, self._open)
+        self._flusher = self._loop.create_task(self._flush_periodically())
+
+    async def async_stop(self) -> None:
+        """
+        Write buffered records, close the database and stop the ledger thread. A periodic flush in progress is waited
+            for rather than cancelled.
+
+        """
+
+        self._stopping.set()
+        if self._flusher is not None:
+            await self._flusher
+            self._flusher = None
+        if self._full_flush is not None:
+            await self._full_flush
+        await self.async_flush()
+        await self._loop.run_in_executor(self._executor, self._close)
+        self._executor.shutdown(wait=False)
+
+    def _open(self) -> None:
+        """Open the database and create the schema. Runs in the ledger thread."""
+        self._connection = sqlite3.connect(self._path)
+        for statement in _SCHEMA:
+            self._connection.execute(statement)
+        self._connection.commit()
+
+    def _close(self) -> None:
+        """Close the database. Runs in the ledger thread."""
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _record(self, **fields) -> None:
+        """
+        Buffer a record, flushing if the buffer is full.
+
+        :param fields: Record fields, missing ones are NULL.
+
+        """
+
+        fields.setdefault("ts", time())
+        self._buffer.append(tuple(fields.get(column) for column in _COLUMNS))
+        self._trim()
+        if len(self._buffer) >= LEDGER_MAX_BATCH and (self._full_flush is None or self._full_flush.done()):
+            self._full_flush = self._loop.create_task(self._flush_logged())
+
+    def record_query(self, address: str, kwh_current: float, kwh_to_compensate: float) -> None:
+        """
+        Record a kWh query response.
+
+        :param address: Householder address in Robonomics Parachain.
+        :param kwh_current: Net kWh sent with the query.
+        :param kwh_to_compensate: Uncompensated kWh got from the agent.
+
+        """
+
+        self._record(kind=KIND_QUERY, address=address, kwh=kwh_to_compensate, total=kwh_current - kwh_to_compensate)
+
+    def record_liability(self, address: str, liability_query: dict, kwh: float) -> None:
+        """
+        Record a signed liability query sent to the agent.
+
+        :param address: Householder address in Robonomics Parachain.
+        :param liability_query: Liability query as sent to the agent.
+        :param kwh: Amount of kWh to compensate.
+
+        """
+
+        self._record(
+            kind=KIND_LIABILITY,
+            address=address,
+            ts=liability_query["timestamp"],
+            kwh=kwh,
+            technics=liability_query["technics"],
+            signature=str(liability_query["promisee_signature"]),
+        )
+
+    def record_report(self, address: str, response: dict, kwh: float) -> None:
+        """
+        Record a liability report got from the agent.
+
+        :param address: Householder address in Robonomics Parachain.
+        :param response: Liability report message.
+        :param kwh: Amount of kWh requested to compensate.
+
+        """
+
+        self._record(
+            kind=KIND_REPORT,
+            address=address,
+            kwh=kwh,
+            total=response.get("total"),
+            report=response.get("report"),
+            success=int(bool(response["success"])),
+        )
+
+    async def async_flush(self) -> None:
+        """Write buffered records in one transaction. If it fails, the records are put back for the next flush."""
+        if not self._buffer:
+            return
+        batch, self._buffer = self._buffer, []
+        try:
+            await self._loop.run_in_executor(self._executor, self._write, batch)
+        except Exception:
+            # Cancelling doesn't stop the write in the ledger thread, only records failed to write are put back.
+            self._buffer[:0] = batch
+            self._trim()
+            raise
+
+    def _trim(self) -> None:
+        """Drop the oldest buffered records over ``LEDGER_MAX_BUFFER``, e.g. while the database can't be written."""
+        excess = len(self._buffer) - LEDGER_MAX_BUFFER
+        if excess > 0:
+            del self._buffer[:excess]
+            self.dropped += excess
+            _LOGGER.warning(f"Ledger buffer is full, dropped {excess} oldest records, {self.dropped} in total")
+
+    async def _flush_logged(self) -> None:
+        """Flush buffered records, logging failures."""
+        try:
+            await self.async_flush()
+        except Exception as e:
+            _LOGGER.error(f"Failed to write to the ledger, {len(self._buffer)} records kept to retry: {e}")
+
+    def _write(self, batch: tp.List[tuple]) -> None:
+        """
+        Write records. Runs in the ledger thread.
+
+        :param batch: Records to write.
+
+        """
+
+        with self._connection:
+            self._connection.executemany(
+                f"INSERT INTO events ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})", batch
+            )
+        _LOGGER.debug(f"Wrote {len(batch)} records to the ledger")
+
+    async def _flush_periodically(self) -> None:
+        """Flush buffered records every ``LEDGER_FLUSH_INTERVAL`` seconds until stopping."""
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), LEDGER_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                await self._flush_logged()
+
+    async def async_query(
+        self,
+        address: tp.Optional[str] = None,
+        start: tp.Optional[float] = None,
+        end: tp.Optional[float] = None,
+        kind: tp.Optional[str] = None,
+        group_by: tp.Optional[str] = None,
+    ) -> tp.List[dict]:
+        """
+        Get records or successfully compensated kWh aggregated per period. Buffered records are written first.
+
+        :param address: Householder address in Robonomics Parachain. All the householders if not given.
+        :param start: Range start timestamp, inclusive.
+        :param end: Range end timestamp, exclusive.
+        :param kind: Records kind, one of ``KIND_QUERY``, ``KIND_LIABILITY``, ``KIND_REPORT``. Ignored if grouped.
+        :param group_by: ``day``, ``month`` or ``year`` to aggregate successful compensations.
+
+        :return: Records or aggregates as dicts.
+
+        """
+
+        await self.async_flush()
+        return await self._loop.run_in_executor(self._executor, self._select, address, start, end, kind, group_by)
+
+    def _select(
+        self,
+        address: tp.Optional[str],
+        start: tp.Optional[float],
+        end: tp.Optional[float],
+        kind: tp.Optional[str],
+        group_by: tp.Optional[str],
+    ) -> tp.List[dict]:
+        """
+        Run a range or aggregate query. Runs in the ledger thread.
+
+        :param address: Householder address.
+        :param start: Range start timestamp.
+        :param end: Range end timestamp.
+        :param kind: Records kind.
+        :param group_by: Aggregation period.
+
+        :return: Records or aggregates as dicts.
+
+        """
+
+        conditions, params = [], []
+        if group_by is not None:
+            kind = KIND_REPORT
+            conditions.append("success = 1")
+        for condition, value in (("address = ?", address), ("kind = ?", kind), ("ts >= ?", start), ("ts < ?", end)):
+            if value is not None:
+                conditions.append(condition)
+                params.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        if group_by is not None:
+            sql = (
+                f"SELECT strftime('{GROUP_BY_FORMATS[group_by]}', ts, 'unixepoch', 'localtime') AS period, address, "
+                f"COUNT(*) AS compensations, SUM(kwh) AS kwh FROM events {where} "
+                f"GROUP BY period, address ORDER BY period, address"
+            )
+        else:
+            sql = f"SELECT {', '.join(_COLUMNS)} FROM events {where} ORDER BY ts"
+
+        cursor = self._connection.execute(sql, params)
+        names = [description[0] for description in cursor.description]
+        return [dict(zip(names, row)) for row in cursor.fetchall()]
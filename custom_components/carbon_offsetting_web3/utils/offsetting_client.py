@@ -3,56 +3,52 @@ Handles interacting with offsetting agent
 """
 
 import logging
+import typing as tp
 from time import time
 
-import ipfshttpclient2
 import robonomicsinterface
 
 from ..const import LAST_COMPENSATION_DATE_QUERY_TOPIC, LIABILITY_QUERY_TOPIC
+from .ipfs import BackgroundRunner, IPFSGateway, pin_to_gateways
 from .pubsub import pubsub_send
-from .thread_wrapper import to_thread
+from .technics import encode_technics
 
 _LOGGER = logging.getLogger(__name__)
 
 
-@to_thread
-def ipfs_client_thread_wrapper(ipfs_gw: str, ipfs_auth: tuple[str, str], content: dict):
-    """
-    Wrapped IPFS 'Add JSON' functionality to be used in async methods. Uploads any dict (JSON) to IPFS.
-
-    :param ipfs_gw: IPFS gateway to upload through.
-    :param ipfs_auth: Gateway auth header (login, password).
-    :param content: Content to upload.
-
-    :return: IPFS CID.
-
-    """
-    with ipfshttpclient2.connect(addr=ipfs_gw, auth=ipfs_auth) as client:
-        return client.add_json(content)
-
-
 async def send_offset_query(
     geo: str,
     kwh: float,
-    ipfs_gw: str,
-    ipfs_auth: dict[str, str],
+    ipfs_gateways: tp.List[IPFSGateway],
     promisee: str,
     liability_signer: robonomicsinterface.Liability,
-):
+    publish: tp.Callable[[str, dict], tp.Awaitable[None]] = pubsub_send,
+    extra_technics: tp.Optional[dict] = None,
+    compress: bool = False,
+    run_in_background: tp.Optional[BackgroundRunner] = None,
+) -> dict:
     """
     Gather query message to send to an Agent to create new compensation liability.
 
     :param geo: Home coordinates.
     :param kwh: Total energy consumption, subtracted with energy production.
-    :param ipfs_gw: IPFS gateway to upload liability technics through.
-    :param ipfs_auth: Gateway auth header (login, password).
+    :param ipfs_gateways: IPFS gateways to pin liability technics to, as (multiaddr, auth header getter). Pinned
+        concurrently, the first returned CID is used.
     :param promisee: Promisee (client) address in Robonomics Parachain.
     :param liability_signer: robonomicsinterface.Liability instance with a promisee seed.
+    :param publish: Coroutine function to publish the query with, e.g. a batching one. Defaults to a new PubSub
+        connection per call.
+    :param extra_technics: Additional data to pin alongside the coordinates and kWh, e.g. an emissions summary.
+    :param compress: Whether to upload the technics gzipped. Only the root CID goes to the liability either way.
+    :param run_in_background: Function to run the report of the pins to the rest of the gateways with. A task kept
+        until done by default.
+
+    :return: Liability query sent.
 
     """
 
-    content = dict(geo=geo, kwh=kwh)
-    technics = await ipfs_client_thread_wrapper(ipfs_gw, ipfs_auth, content)
+    content = dict(geo=geo, kwh=kwh, **(extra_technics or {}))
+    technics = await pin_to_gateways(ipfs_gateways, encode_technics(content, compress), run_in_background)
     economics = 0
     promisee_signature = liability_signer.sign_liability(technics, economics)
 
@@ -64,18 +60,23 @@ async def send_offset_query(
         timestamp=time(),
     )
     _LOGGER.debug(f"liability_query: {liability_query}")
-    await pubsub_send(LIABILITY_QUERY_TOPIC, str(liability_query))
+    await publish(LIABILITY_QUERY_TOPIC, liability_query)
+    return liability_query
 
 
-async def send_last_compensation_date_query(address: str, kwh_current: float):
+async def send_last_compensation_date_query(
+    address: str, kwh_current: float, publish: tp.Callable[[str, dict], tp.Awaitable[None]] = pubsub_send
+):
     """
     Gather query message to send to an Agent to get last compensation date and total amount of kWh compensated.
 
     :param address: Householder address in Robonomics Parachain.
     :param kwh_current: Current total amount of kWh consumed subtracted with current total amount of kWh produced.
+    :param publish: Coroutine function to publish the query with, e.g. a batching one. Defaults to a new PubSub
+        connection per call.
 
     """
 
     last_compensation_date_query = dict(address=address, kwh_current=kwh_current, timestamp=time())
     _LOGGER.debug(f"last_compensation_date_query: {last_compensation_date_query}")
-    await pubsub_send(LAST_COMPENSATION_DATE_QUERY_TOPIC, str(last_compensation_date_query))
+    await publish(LAST_COMPENSATION_DATE_QUERY_TOPIC, last_compensation_date_query)
@@ -0,0 +1,166 @@
+"""Pre-flight probe of IPFS gateways and agent nodes: reachability and latency."""
+
+import asyncio
+import logging
+import typing as tp
+from time import monotonic
+
+import ipfshttpclient2
+from robonomicsinterface import Account
+from substrateinterface import SubstrateInterface
+
+from .ipfs import IPFSGateway
+from .pubsub import AbortablePubSub
+from .thread_wrapper import to_thread
+
+_LOGGER = logging.getLogger(__name__)
+
+PROBE_CONTENT = {"probe": "carbon_offsetting_web3"}
+
+# Endpoint, latency in seconds or None if failed, error if failed.
+ProbeResult = tp.Tuple[str, tp.Optional[float], tp.Optional[str]]
+
+
+def parse_agent_multiaddrs(raw: str) -> tp.List[str]:
+    """
+    Parse agent node multiaddrs user input, separated with commas or new lines.
+
+    :param raw: User input.
+
+    :return: List of multiaddrs.
+
+    """
+
+    multiaddrs = [multiaddr.strip() for multiaddr in raw.replace(",", "\n").splitlines() if multiaddr.strip()]
+    for multiaddr in multiaddrs:
+        if not multiaddr.startswith("/") or " " in multiaddr:
+            raise ValueError(f"Malformed agent multiaddr: {multiaddr}")
+    return multiaddrs
+
+
+@to_thread
+def probe_ipfs_gateway(ipfs_gw: str, ipfs_auth: tuple, timeout: float) -> float:
+    """
+    Connect to an IPFS gateway and upload a small constant document, so repeated probes don't pin anything new.
+
+    :param ipfs_gw: IPFS gateway multiaddr.
+    :param ipfs_auth: Gateway auth header.
+    :param timeout: Request timeout, s, for the thread to end if the probe is given up on.
+
+    :return: Round-trip time of the upload, s.
+
+    """
+
+    started = monotonic()
+    with ipfshttpclient2.connect(addr=ipfs_gw, auth=ipfs_auth, timeout=timeout) as client:
+        client.add_json(PROBE_CONTENT)
+    return monotonic() - started
+
+
+@to_thread
+def probe_agent_node(multiaddr: str, timeout: float) -> float:
+    """
+    Connect to an agent node via PubSub. The node connection is closed afterwards.
+
+    :param multiaddr: Agent node multiaddr.
+    :param timeout: Node socket timeout, s, for the thread to end if the probe is given up on.
+
+    :return: Connection time, s.
+
+    """
+
+    pubsub_ = AbortablePubSub(Account())
+    service_functions = pubsub_._service_functions
+    started = monotonic()
+    # Opened here rather than lazily by robonomicsinterface, which doesn't allow setting a socket timeout.
+    service_functions.interface = SubstrateInterface(
+        url=service_functions.remote_ws,
+        ss58_format=32,
+        type_registry_preset="substrate-node-template",
+        type_registry=service_functions.type_registry,
+        ws_options={"timeout": timeout},
+    )
+    try:
+        result = pubsub_.connect(multiaddr)
+    finally:
+        pubsub_.close()
+    if result is False:
+        raise ConnectionError(f"PubSub failed to connect to {multiaddr}")
+    return monotonic() - started
+
+
+async def _probe(endpoint: str, probe: tp.Awaitable[float], timeout: float) -> ProbeResult:
+    """
+    Run a probe within a timeout.
+
+    :param endpoint: Probed endpoint.
+    :param probe: Probe coroutine.
+    :param timeout: Time to give up after, s.
+
+    :return: Probe result.
+
+    """
+
+    try:
+        latency = await asyncio.wait_for(probe, timeout=timeout)
+    except asyncio.TimeoutError:
+        return endpoint, None, f"no response in {timeout:.0f}s"
+    except Exception as e:
+        return endpoint, None, str(e) or type(e).__name__
+    _LOGGER.debug(f"Probed {endpoint} in {latency:.3f}s")
+    return endpoint, latency, None
+
+
+async def probe_endpoints(
+    ipfs_gateways: tp.List[IPFSGateway], agent_multiaddrs: tp.List[str], timeout: float
+) -> tp.Tuple[tp.List[ProbeResult], tp.List[ProbeResult]]:
+    """
+    Probe all the IPFS gateways and agent nodes concurrently, so the whole probe takes at most the timeout.
+
+    :param ipfs_gateways: IPFS gateways as (multiaddr, auth header getter).
+    :param agent_multiaddrs: Agent node multiaddrs.
+    :param timeout: Time to give up on an endpoint after, s.
+
+    :return: IPFS gateways and agent nodes results, fastest first, failed last.
+
+    """
+
+    results = await asyncio.gather(
+        *(
+            _probe(ipfs_gw, probe_ipfs_gateway(ipfs_gw, ipfs_auth(), timeout), timeout)
+            for ipfs_gw, ipfs_auth in ipfs_gateways
+        ),
+        *(_probe(multiaddr, probe_agent_node(multiaddr, timeout), timeout) for multiaddr in agent_multiaddrs),
+    )
+    ipfs_results = sorted(results[: len(ipfs_gateways)], key=_rank)
+    agent_results = sorted(results[len(ipfs_gateways) :], key=_rank)
+    return ipfs_results, agent_results
+
+
+def _rank(result: ProbeResult) -> float:
+    """
+    Sort key putting the fastest endpoints first and the failed ones last.
+
+    :param result: Probe result.
+
+    :return: Latency or infinity if failed.
+
+    """
+
+    return float("inf") if result[1] is None else result[1]
+
+
+def format_probe_results(results: tp.List[ProbeResult]) -> str:
+    """
+    Format probe results to show in the configuration form.
+
+    :param results: Probe results.
+
+    :return: One line per endpoint.
+
+    """
+
+    return "\n".join(
+        f"- {endpoint}: {latency * 1000:.0f} ms" if latency is not None else f"- {endpoint}: failed, {error}"
+        for endpoint, latency, error in results
+    )
@@ -6,27 +6,138 @@ import typing as tp
 from ast import literal_eval
 
 from robonomicsinterface import Account, PubSub
+from robonomicsinterface.decorators import open_interface
 
-from ..const import AGENT_NODE_MULTIADDR
+from ..const import (
+    AGENT_NODE_MULTIADDR,
+    RESOURCE_TEARDOWN_TIMEOUT,
+    SUBSCRIPTION_ABORT_INTERVAL,
+    SUBSCRIPTION_RETRY_DELAY,
+)
 from .thread_wrapper import to_thread
 
 _LOGGER = logging.getLogger(__name__)
 
 
-def parse_income_message(raw_data: tp.List[tp.Any]) -> dict:
+ENVELOPE_PREFIX = b"co2:"
+# Only trusted as the first key: an ``'address'`` further in the frame may belong to a nested value.
+LEGACY_ADDRESS_PREFIX = b"{'address': '"
+BATCH_PREFIX = b"{'batch': "
+
+
+def extract_address(frame: bytes) -> tp.Optional[bytes]:
+    """
+    Cheaply get the householder address from a raw PubSub frame without decoding it. Supports the envelope format
+        ``co2:<address>/<correlation_id>|<payload>`` and legacy bare payloads starting with an ``'address'`` key. Batches
+        of responses carry many addresses and are never pre-filtered.
+
+    :param frame: Raw PubSub frame.
+
+    :return: Address bytes or None if it could not be located.
+
+    """
+
+    if frame.startswith(BATCH_PREFIX):
+        return None
+
+    if frame.startswith(ENVELOPE_PREFIX):
+        end = frame.find(b"|", len(ENVELOPE_PREFIX))
+        if end == -1:
+            return None
+        return frame[len(ENVELOPE_PREFIX) : end].partition(b"/")[0]
+
+    if not frame.startswith(LEGACY_ADDRESS_PREFIX):
+        return None
+    start = len(LEGACY_ADDRESS_PREFIX)
+    end = frame.find(b"'", start)
+    if end == -1:
+        return None
+    return frame[start:end]
+
+
+class AddressFilter:
+    """
+    Pre-filter dropping raw frames addressed to other householders before any full decode. Costs a set lookup per
+        frame however many householders are served.
+
+    """
+
+    def __init__(self, addresses: tp.Iterable[str] = ()) -> None:
+        """
+        Class init function, sets all class attributes.
+
+        :param addresses: Householders addresses in Robonomics Parachain.
+
+        """
+
+        self._addresses: tp.Set[bytes] = {address.encode() for address in addresses}
+        self.matched = 0
+        self.skipped = 0
+
+    def add(self, address: str) -> None:
+        """
+        Start accepting frames addressed to a householder.
+
+        :param address: Householder address in Robonomics Parachain.
+
+        """
+
+        self._addresses.add(address.encode())
+
+    def discard(self, address: str) -> None:
+        """
+        Stop accepting frames addressed to a householder.
+
+        :param address: Householder address in Robonomics Parachain.
+
+        """
+
+        self._addresses.discard(address.encode())
+
+    def matches(self, frame: bytes) -> bool:
+        """
+        Check whether a raw frame should be decoded. Frames with no address found are passed through.
+
+        :param frame: Raw PubSub frame.
+
+        :return: True if the frame is addressed to one of our householders or can't be pre-filtered.
+
+        """
+
+        if self.is_foreign(frame):
+            self.skipped += 1
+            return False
+        self.matched += 1
+        return True
+
+    def is_foreign(self, frame: bytes) -> bool:
+        """
+        Check whether a raw frame is surely addressed to another householder. Doesn't affect counters.
+
+        :param frame: Raw PubSub frame.
+
+        :return: True if the frame has an address other than ours.
+
+        """
+
+        address = extract_address(frame)
+        return address is not None and address not in self._addresses
+
+
+def parse_income_message(raw_data: tp.Union[bytes, tp.List[int]]) -> dict:
     """
     Parse income PubSub Message.
 
-    :param raw_data: Income PubSub Message.
+    :param raw_data: Income PubSub Message, either raw bytes or list of byte values.
 
     :return: technics, amount, promisee, promisee_signature.
 
     """
 
-    for i in range(len(raw_data)):
-        raw_data[i] = chr(raw_data[i])
-    data: str = "".join(raw_data)
-    data_dict: tp.Dict[tp.Union[dict, int, str]] = literal_eval(data)
+    data = bytes(raw_data)
+    if data.startswith(ENVELOPE_PREFIX):
+        data = data[data.index(b"|") + 1 :]
+    data_dict: tp.Dict[str, tp.Union[dict, int, str]] = literal_eval(data.decode())
 
     return data_dict
 
@@ -63,12 +174,181 @@ def subscribe_response_topic(response_topic, callback):
     pubsub_.subscribe(response_topic, result_handler=callback)
 
 
-async def subscribe_response_topic_wrapper(response_topic, callback, timeout):
+class AbortablePubSub(PubSub):
     """
-    Timeout wrapper for PubSub subscription function.
+    ``PubSub`` which node connection can be closed, or aborted from another thread. Only these methods touch
+        robonomicsinterface internals, a stand-in implementing them can replace the class, e.g. in ``tools/load_test.py``.
 
-    :param response_topic: Topic in PubSub to subscribe to.
-    :param callback: Callback function to execute when new message registered.
-    :param timeout: Timeout to cancel subscription if no response got via PubSub.
     """
-    await asyncio.wait_for(subscribe_response_topic(response_topic, callback), timeout=timeout)
+
+    def subscribe_until_aborted(self, response_topic: str, callback: tp.Callable) -> None:
+        """
+        Subscribe to a query response topic in Robonomics Pubsub until the callback returns a value or the connection
+            is aborted with ``abort``. Unlike ``PubSub.subscribe``, doesn't resubscribe on a new connection when the
+            connection closes, so aborting it ends the subscription thread. The connection is closed on return.
+            Blocking.
+
+        :param response_topic: Topic in PubSub to subscribe to.
+        :param callback: Callback function to execute when new message registered.
+
+        """
+
+        open_interface(self._service_functions)
+        _LOGGER.debug(f"Subscribing to topic '{response_topic}'")
+        try:
+            self._service_functions.interface.rpc_request("pubsub_subscribe", [response_topic], callback)
+        finally:
+            self._service_functions.interface.websocket.shutdown()
+
+    def abort(self) -> None:
+        """Abort the node connection, if opened, waking up the thread blocked receiving on it."""
+        interface = self._service_functions.interface
+        if interface is not None and interface.websocket is not None:
+            interface.websocket.abort()
+
+    def close(self) -> None:
+        """Close the node connection, if opened."""
+        interface = self._service_functions.interface
+        if interface is not None:
+            interface.close()
+
+
+class PubSubTransport:
+    """
+    PubSub connection shared by all the householders: one publisher connected once and one long-lived subscription
+        per response topic. Incoming raw frames are handed over to ``on_frame``.
+
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        response_topics: tp.List[str],
+        on_frame: tp.Callable[[str, bytes], None],
+        agent_multiaddr: str = AGENT_NODE_MULTIADDR,
+    ) -> None:
+        """
+        Class init function, sets all class attributes.
+
+        :param loop: Event loop to run subscriptions in.
+        :param response_topics: Topics in PubSub to subscribe to.
+        :param on_frame: Function to hand over raw frames with. Called from subscription threads.
+        :param agent_multiaddr: Agent node multiaddr to publish through.
+
+        """
+
+        self._loop = loop
+        self._response_topics = response_topics
+        self._on_frame = on_frame
+        self._agent_multiaddr = agent_multiaddr
+        self._publisher: tp.Optional[AbortablePubSub] = None
+        self._publish_lock = asyncio.Lock()
+        self._subscriptions: tp.List[asyncio.Task] = []
+        self._subscribers: tp.Dict[str, AbortablePubSub] = {}
+        self._stopping = False
+
+    @property
+    def agent_multiaddr(self) -> str:
+        """
+        Agent node multiaddr the publisher connects to.
+
+        """
+
+        return self._agent_multiaddr
+
+    def start(self) -> None:
+        """Subscribe to the response topics."""
+        for response_topic in self._response_topics:
+            self._subscriptions.append(self._loop.create_task(self._keep_subscribed(response_topic)))
+
+    async def stop(self) -> None:
+        """
+        Abort the subscriptions connections, wait for the subscription threads to end and close the publisher
+            connection. Aborting is repeated until the threads end, in case a subscription was connecting meanwhile.
+
+        """
+        self._stopping = True
+        if self._publisher is not None:
+            try:
+                await asyncio.to_thread(self._publisher.close)
+            except Exception as e:
+                _LOGGER.warning(f"Failed to close PubSub publisher connection: {e}")
+            self._publisher = None
+
+        pending = set(self._subscriptions)
+        deadline = self._loop.time() + RESOURCE_TEARDOWN_TIMEOUT
+        while pending and self._loop.time() < deadline:
+            for subscriber in list(self._subscribers.values()):
+                try:
+                    subscriber.abort()
+                except Exception as e:
+                    _LOGGER.debug(f"Failed to abort PubSub subscription connection: {e}")
+            _, pending = await asyncio.wait(pending, timeout=SUBSCRIPTION_ABORT_INTERVAL)
+        if pending:
+            _LOGGER.warning(f"{len(pending)} PubSub subscription threads still running after stop")
+            for subscription in pending:
+                subscription.cancel()
+        self._subscriptions.clear()
+        self._subscribers.clear()
+
+    async def _keep_subscribed(self, response_topic: str) -> None:
+        """
+        Keep a subscription to a response topic, resubscribing if it fails.
+
+        :param response_topic: Topic in PubSub to subscribe to.
+
+        """
+
+        def callback(obj, update_nr, subscription_id) -> tp.Optional[bool]:
+            """
+            PubSub subscription callback function to execute at new message arrival. Only hands the raw frame over.
+
+            :param obj: Message object.
+            :param update_nr: Events iterator.
+            :param subscription_id: Subscription ID.
+
+            :return: True when the transport is stopped - to cancel subscription.
+
+            """
+
+            self._on_frame(response_topic, bytes(obj["params"]["result"]["data"]))
+            if self._stopping:
+                return True
+
+        while not self._stopping:
+            self._subscribers[response_topic] = AbortablePubSub(Account())
+            try:
+                await asyncio.to_thread(
+                    self._subscribers[response_topic].subscribe_until_aborted, response_topic, callback
+                )
+            except Exception as e:
+                if self._stopping:
+                    break
+                _LOGGER.warning(f"Subscription to '{response_topic}' failed: {e}")
+            if not self._stopping:
+                await asyncio.sleep(SUBSCRIPTION_RETRY_DELAY)
+
+    async def publish(self, topic: str, data: tp.Any) -> None:
+        """
+        Send data to a topic via the shared publisher, connecting it at first use.
+
+        :param topic: Topic to send to.
+        :param data: Data to send.
+
+        """
+
+        _LOGGER.debug(f"Sending data {data} to topic {topic}.")
+        async with self._publish_lock:
+            if self._publisher is None:
+                publisher = AbortablePubSub(Account())
+                _LOGGER.debug(
+                    f"PubSub connect result: {await asyncio.to_thread(publisher.connect, self._agent_multiaddr)}"
+                )
+                await asyncio.sleep(1)
+                self._publisher = publisher
+            try:
+                result = await asyncio.to_thread(self._publisher.publish, topic, str(data))
+            except Exception:
+                self._publisher = None
+                raise
+        _LOGGER.debug(f"PubSub send result: {result}")
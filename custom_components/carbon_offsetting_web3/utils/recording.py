@@ -0,0 +1,180 @@
+"""Recording of raw PubSub traffic and its replay through the dispatch pipeline."""
+
+import asyncio
+import logging
+import math
+import os
+import struct
+import threading
+import typing as tp
+from time import monotonic, time
+
+from ..const import RECORDING_MAX_BYTES, REPLAY_DRAIN_TIMEOUT
+from .dispatcher import ResponseDispatcher
+from .pubsub import AddressFilter
+
+_LOGGER = logging.getLogger(__name__)
+
+RECORDING_MAGIC = b"CO2REC1\n"
+# Receive timestamp, topic length, frame length.
+_RECORD_HEADER = struct.Struct(">dHI")
+
+
+class TrafficRecorder:
+    """
+    Append-only file of raw response frames. Each record is a fixed-size header with the receive timestamp and
+        lengths followed by the topic and the frame as they came, so a recording costs little more than the traffic.
+
+    """
+
+    def __init__(self, path: str, max_bytes: int = RECORDING_MAX_BYTES) -> None:
+        """
+        Class init function, sets all class attributes.
+
+        :param path: Recording file path. Appended to if exists.
+        :param max_bytes: File size to stop recording at.
+
+        """
+
+        self._path = path
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._file: tp.Optional[tp.BinaryIO] = None
+        self._size = 0
+
+    def open(self) -> None:
+        """Open the recording file. Blocking."""
+        self._file = open(self._path, "ab")
+        self._size = self._file.tell()
+        if self._size == 0:
+            self._file.write(RECORDING_MAGIC)
+            self._size = len(RECORDING_MAGIC)
+        _LOGGER.debug(f"Recording PubSub traffic to {self._path}")
+
+    def close(self) -> None:
+        """Flush and close the recording file. Blocking."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def record(self, topic: str, frame: bytes) -> None:
+        """
+        Append a frame. Safe to call from any thread.
+
+        :param topic: Topic the frame came from.
+        :param frame: Raw PubSub frame.
+
+        """
+
+        encoded_topic = topic.encode()
+        record = _RECORD_HEADER.pack(time(), len(encoded_topic), len(frame)) + encoded_topic + frame
+        with self._lock:
+            if self._file is None:
+                return
+            if self._size + len(record) > self._max_bytes:
+                _LOGGER.warning(f"Recording {self._path} reached {self._max_bytes} bytes, stopped recording")
+                self._file.close()
+                self._file = None
+                return
+            self._file.write(record)
+            self._size += len(record)
+
+
+def read_recording(path: str) -> tp.Iterator[tp.Tuple[float, str, bytes]]:
+    """
+    Read a recording made by ``TrafficRecorder``. A record truncated by a crash ends the recording.
+
+    :param path: Recording file path.
+
+    :return: Receive timestamp, topic and raw frame of each record.
+
+    """
+
+    with open(path, "rb") as f:
+        if f.read(len(RECORDING_MAGIC)) != RECORDING_MAGIC:
+            raise ValueError(f"{path} is not a PubSub traffic recording")
+        while True:
+            header = f.read(_RECORD_HEADER.size)
+            if len(header) < _RECORD_HEADER.size:
+                return
+            timestamp, topic_length, frame_length = _RECORD_HEADER.unpack(header)
+            body = f.read(topic_length + frame_length)
+            if len(body) < topic_length + frame_length:
+                return
+            yield timestamp, body[:topic_length].decode(), body[topic_length:]
+
+
+async def replay_recording(
+    loop: asyncio.AbstractEventLoop,
+    path: str,
+    addresses: tp.Iterable[str],
+    maxsize: int,
+    overflow_policy: str,
+    speed: float = 1.0,
+) -> tp.Dict[str, tp.Any]:
+    """
+    Feed a recording through a separate dispatch pipeline with the given settings and measure it. Frames are enqueued
+        from a thread, as subscriptions do, so the measured latency includes the thread handoff.
+
+    :param loop: Event loop to run the pipeline in.
+    :param path: Recording file path.
+    :param addresses: Householder addresses to treat as ours.
+    :param maxsize: Frame queue size.
+    :param overflow_policy: Frame queue overflow policy.
+    :param speed: Replay speed relative to the recorded one. 0 to feed frames as fast as possible.
+
+    :return: Replay report: frames fed, processed and dropped, throughput and latency percentiles. Frames still
+        unprocessed ``REPLAY_DRAIN_TIMEOUT`` seconds after the last one was fed are reported as ``unprocessed``.
+
+    """
+
+    frames = await loop.run_in_executor(None, lambda: list(read_recording(path)))
+    address_filter = AddressFilter(addresses)
+    dispatcher = ResponseDispatcher(loop, address_filter, maxsize, overflow_policy)
+    latencies: tp.List[float] = []
+    dispatcher.latency_sink = latencies.append
+    dispatcher.start()
+
+    def feed() -> None:
+        """Enqueue the frames keeping the recorded intervals scaled by the speed."""
+        started = monotonic()
+        for timestamp, topic, frame in frames:
+            if speed:
+                delay = (timestamp - frames[0][0]) / speed - (monotonic() - started)
+                if delay > 0:
+                    threading.Event().wait(delay)
+            dispatcher.enqueue(topic, frame)
+
+    def unprocessed() -> int:
+        """Frames neither processed nor dropped yet."""
+        stats = dispatcher.stats
+        return len(frames) - dispatcher.processed - stats["dropped_oldest"] - stats["dropped_foreign"]
+
+    started = monotonic()
+    try:
+        await loop.run_in_executor(None, feed)
+        drain_deadline = monotonic() + REPLAY_DRAIN_TIMEOUT
+        while unprocessed() and monotonic() < drain_deadline:
+            await asyncio.sleep(0.01)
+        elapsed = monotonic() - started
+        remaining = unprocessed()
+    finally:
+        await dispatcher.stop()
+
+    latencies.sort()
+    report = dict(
+        frames=len(frames),
+        bytes=sum(len(frame) for _, _, frame in frames),
+        elapsed=round(elapsed, 3),
+        throughput=round(dispatcher.processed / elapsed, 1) if elapsed else None,
+        unprocessed=remaining,
+        **dispatcher.stats,
+    )
+    if latencies:
+        for percentile in (50, 95, 99):
+            rank = max(math.ceil(percentile / 100 * len(latencies)), 1)
+            report[f"latency_p{percentile}_ms"] = round(latencies[rank - 1] * 1000, 3)
+        report["latency_max_ms"] = round(latencies[-1] * 1000, 3)
+    _LOGGER.debug(f"Replayed {os.path.basename(path)}: {report}")
+    return report
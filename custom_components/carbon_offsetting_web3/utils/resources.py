@@ -0,0 +1,127 @@
+"""Tracking of resources held by an entry or shared by all the entries, to release all of them on unload."""
+
+import asyncio
+import inspect
+import logging
+import typing as tp
+from time import monotonic
+
+from ..const import RESOURCE_TEARDOWN_TIMEOUT
+
+_LOGGER = logging.getLogger(__name__)
+
+Release = tp.Callable[[], tp.Union[None, tp.Awaitable[None]]]
+
+
+class ResourceRegistry:
+    """
+    Resources registered as release callbacks: connections, subscriptions, files, unsubscribe callbacks. They are
+        released in reverse order of registration, after the tracked background tasks are cancelled, so nothing still
+        running uses a released resource.
+
+    """
+
+    def __init__(self, name: str) -> None:
+        """
+        Class init function, sets all class attributes.
+
+        :param name: Registry name for logging.
+
+        """
+
+        self._name = name
+        self._releases: tp.List[tp.Tuple[str, Release]] = []
+        self._tasks: tp.Set[asyncio.Task] = set()
+        self._closed = False
+
+    @property
+    def stats(self) -> tp.Dict[str, int]:
+        """
+        Amount of resources and running tasks held.
+
+        """
+
+        return dict(resources=len(self._releases), tasks=len(self._tasks))
+
+    def add(self, description: str, release: Release) -> None:
+        """
+        Register a resource.
+
+        :param description: Resource description for logging.
+        :param release: Function or coroutine function releasing the resource.
+
+        """
+
+        self._releases.append((description, release))
+
+    def track(self, coro: tp.Coroutine, description: str) -> asyncio.Task:
+        """
+        Run a coroutine as a background task cancelled on teardown.
+
+        :param coro: Coroutine.
+        :param description: Task name.
+
+        :return: Task.
+
+        """
+
+        if self._closed:
+            coro.close()
+            raise RuntimeError(f"{self._name} is torn down, can't run {description}")
+        task = asyncio.get_running_loop().create_task(coro, name=description)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def run(self, coro: tp.Coroutine, description: str) -> tp.Any:
+        """
+        Run a coroutine as a tracked task and wait for its result.
+
+        :param coro: Coroutine.
+        :param description: Task name.
+
+        :return: Coroutine result.
+
+        """
+
+        return await self.track(coro, description)
+
+    async def async_teardown(self) -> tp.Dict[str, tp.Any]:
+        """
+        Cancel the tracked tasks and release the resources in reverse order. Each step is bounded by
+            ``RESOURCE_TEARDOWN_TIMEOUT``, failures are logged and don't stop the teardown.
+
+        :return: Teardown cost: resources released, failures, tasks cancelled and elapsed time.
+
+        """
+
+        self._closed = True
+        started = monotonic()
+
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.wait(tasks, timeout=RESOURCE_TEARDOWN_TIMEOUT)
+
+        failed = 0
+        released = 0
+        while self._releases:
+            description, release = self._releases.pop()
+            try:
+                result = release()
+                if inspect.isawaitable(result):
+                    await asyncio.wait_for(result, timeout=RESOURCE_TEARDOWN_TIMEOUT)
+                released += 1
+            except Exception as e:
+                failed += 1
+                _LOGGER.warning(f"{self._name}: failed to release {description}: {e!r}")
+
+        cost = dict(
+            released=released,
+            failed=failed,
+            tasks_cancelled=len(tasks),
+            elapsed_ms=round((monotonic() - started) * 1000, 1),
+        )
+        _LOGGER.debug(f"{self._name} torn down: {cost}")
+        return cost
@@ -0,0 +1,111 @@
+"""Round-trip time tracking for PubSub queries to derive adaptive response timeouts."""
+
+import logging
+import math
+import typing as tp
+from collections import deque
+
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+
+from ..const import DOMAIN, MIN_RTT_SAMPLES, RTT_SAVE_DELAY, RTT_STORAGE_VERSION, RTT_WINDOW
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class RttTracker:
+    """Rolling per-topic round-trip time distribution, persisted across restarts."""
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        percentile: float,
+        multiplier: float,
+        floor: float,
+        ceiling: float,
+        storage_key: str = f"{DOMAIN}.rtt",
+    ) -> None:
+        """
+        Class init function, sets all class attributes.
+
+        :param hass: HomeAssistant instance.
+        :param percentile: Percentile of the observed round-trip times to base timeouts on, 0-100.
+        :param multiplier: Multiplier applied to the percentile.
+        :param floor: Minimum timeout, s.
+        :param ceiling: Maximum timeout, s.
+        :param storage_key: Key of HomeAssistant storage to persist samples in.
+
+        """
+
+        self._store = Store(hass, RTT_STORAGE_VERSION, storage_key)
+        self._percentile = percentile
+        self._multiplier = multiplier
+        self._floor = floor
+        self._ceiling = ceiling
+        self._samples: tp.Dict[str, tp.Deque[float]] = {}
+
+    async def async_load(self) -> None:
+        """Load samples persisted by previous runs."""
+        data = await self._store.async_load() or {}
+        for topic, samples in data.items():
+            self._samples[topic] = deque(samples, maxlen=RTT_WINDOW)
+        _LOGGER.debug(f"Loaded RTT samples for topics: {list(self._samples)}")
+
+    def add_sample(self, topic: str, rtt: float) -> None:
+        """
+        Register an observed round-trip time and schedule persisting the samples.
+
+        :param topic: Response topic.
+        :param rtt: Time from query publish to response processing, s.
+
+        """
+
+        self._samples.setdefault(topic, deque(maxlen=RTT_WINDOW)).append(rtt)
+        _LOGGER.debug(f"RTT in {topic}: {rtt:.2f}s, new timeout: {self.timeout(topic, self._ceiling):.2f}s")
+        self._store.async_delay_save(self._data_to_save, RTT_SAVE_DELAY)
+
+    def _data_to_save(self) -> tp.Dict[str, tp.List[float]]:
+        """Samples in a JSON-serializable form."""
+        return {topic: list(samples) for topic, samples in self._samples.items()}
+
+    @property
+    def floor(self) -> float:
+        """
+        Minimum timeout, s.
+
+        """
+
+        return self._floor
+
+    def percentile(self, topic: str, percentile: tp.Optional[float] = None) -> tp.Optional[float]:
+        """
+        Nearest-rank percentile of the observed round-trip times.
+
+        :param topic: Response topic.
+        :param percentile: Percentile to get, 0-100. Defaults to the configured one.
+
+        :return: Round-trip time, s, or None if not enough samples observed yet.
+
+        """
+
+        samples = self._samples.get(topic)
+        if not samples or len(samples) < MIN_RTT_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        rank = math.ceil((percentile if percentile is not None else self._percentile) / 100 * len(ordered))
+        return ordered[min(max(rank, 1), len(ordered)) - 1]
+
+    def timeout(self, topic: str, default: float) -> float:
+        """
+        Response timeout for a topic: the percentile times the multiplier, clamped to floor and ceiling.
+
+        :param topic: Response topic.
+        :param default: Timeout to use until enough samples are observed.
+
+        :return: Timeout, s.
+
+        """
+
+        rtt = self.percentile(topic)
+        timeout = default if rtt is None else rtt * self._multiplier
+        return min(max(timeout, self._floor), self._ceiling)
@@ -0,0 +1,30 @@
+"""Detailed liability technics: per-period breakdown and meter readings in one document, optionally compressed."""
+
+import base64
+import gzip
+import json
+import logging
+
+from ..const import TECHNICS_ENCODING_GZIP
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def encode_technics(content: dict, compress: bool) -> dict:
+    """
+    Prepare technics for upload. Compressed technics are wrapped into a small JSON envelope, so they are still
+        uploaded as one JSON document with one root CID.
+
+    :param content: Technics document.
+    :param compress: Whether to gzip the document and embed it base64-encoded.
+
+    :return: Document to upload.
+
+    """
+
+    if not compress:
+        return content
+    raw = json.dumps(content, separators=(",", ":")).encode()
+    packed = base64.b64encode(gzip.compress(raw)).decode()
+    _LOGGER.debug(f"Technics compressed from {len(raw)} to {len(packed)} bytes")
+    return dict(encoding=TECHNICS_ENCODING_GZIP, content=packed)
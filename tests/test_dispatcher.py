@@ -0,0 +1,161 @@
+"""Tests of routing PubSub frames to the handlers waiting on them."""
+
+import asyncio
+import typing as tp
+
+from custom_components.carbon_offsetting_web3.const import OVERFLOW_DROP_OLDEST
+from custom_components.carbon_offsetting_web3.utils.dispatcher import ResponseDispatcher
+from custom_components.carbon_offsetting_web3.utils.pubsub import AddressFilter
+
+TOPIC = "response_topic"
+ADDRESS = "4Gz3ZstjLuYgXbLmJH7KuWjaeFBpLhLBhsAGZFLbKK9kVVyd"
+
+
+async def _run(dispatcher: ResponseDispatcher, frames: tp.Iterable[bytes]) -> None:
+    """
+    Feed frames to a dispatcher and wait until all of them are processed.
+
+    :param dispatcher: Dispatcher to feed.
+    :param frames: Raw PubSub frames.
+
+    """
+
+    frames = list(frames)
+    for frame in frames:
+        dispatcher.enqueue(TOPIC, frame)
+    while dispatcher.processed < len(frames):
+        await asyncio.sleep(0)
+
+
+def _dispatcher() -> ResponseDispatcher:
+    """
+    Started dispatcher accepting frames addressed to the test householder.
+
+    :return: Dispatcher.
+
+    """
+
+    dispatcher = ResponseDispatcher(asyncio.get_running_loop(), AddressFilter([ADDRESS]), 16, OVERFLOW_DROP_OLDEST)
+    dispatcher.start()
+    return dispatcher
+
+
+def test_non_dict_messages_are_skipped():
+    async def scenario():
+        dispatcher = _dispatcher()
+        handled = []
+
+        async def handler(response: dict) -> None:
+            handled.append(response)
+
+        waiting = asyncio.ensure_future(dispatcher.wait_response(TOPIC, ADDRESS, handler, 5))
+        await asyncio.sleep(0)
+        await _run(dispatcher, [b"123", b"[1]", b"{'batch': 1}", f"{{'address': '{ADDRESS}'}}".encode()])
+        await waiting
+        await dispatcher.stop()
+        return handled
+
+    assert asyncio.run(asyncio.wait_for(scenario(), 5)) == [{"address": ADDRESS}]
+
+
+def test_non_dict_batch_items_are_skipped():
+    async def scenario():
+        dispatcher = _dispatcher()
+        handled = []
+
+        async def handler(response: dict) -> None:
+            handled.append(response)
+
+        waiting = asyncio.ensure_future(dispatcher.wait_response(TOPIC, ADDRESS, handler, 5))
+        await asyncio.sleep(0)
+        await _run(dispatcher, [f"{{'batch': [1, 'a', None, {{'address': '{ADDRESS}'}}]}}".encode()])
+        await waiting
+        await dispatcher.stop()
+        return handled
+
+    assert asyncio.run(asyncio.wait_for(scenario(), 5)) == [{"address": ADDRESS}]
+
+
+def test_consumer_survives_failing_frame():
+    async def scenario():
+        dispatcher = _dispatcher()
+        handled = []
+
+        async def handler(response: dict) -> None:
+            handled.append(response)
+
+        # A response without a hashable address fails routing, the next frames must still be processed.
+        waiting = asyncio.ensure_future(dispatcher.wait_response(TOPIC, ADDRESS, handler, 5))
+        await asyncio.sleep(0)
+        await _run(dispatcher, [b"{'batch': [{'address': []}]}", f"{{'address': '{ADDRESS}'}}".encode()])
+        await waiting
+        await dispatcher.stop()
+        return handled, dispatcher.processed
+
+    assert asyncio.run(asyncio.wait_for(scenario(), 5)) == ([{"address": ADDRESS}], 2)
+
+
+def test_waiter_cancelled_while_handling():
+    async def scenario():
+        dispatcher = _dispatcher()
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def handler(response: dict) -> None:
+            started.set()
+            await release.wait()
+
+        waiting = asyncio.ensure_future(dispatcher.wait_response(TOPIC, ADDRESS, handler, None))
+        await asyncio.sleep(0)
+        dispatcher.enqueue(TOPIC, f"{{'address': '{ADDRESS}'}}".encode())
+        await started.wait()
+        waiting.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        while dispatcher.processed < 1:
+            await asyncio.sleep(0)
+        consumer_alive = not dispatcher._consumer.done()
+        await dispatcher.stop()
+        return waiting.cancelled(), consumer_alive
+
+    assert asyncio.run(asyncio.wait_for(scenario(), 5)) == (True, True)
+
+
+def test_response_applied_once_for_overlapping_waiters():
+    async def scenario():
+        dispatcher = _dispatcher()
+        handled = []
+
+        async def first(response: dict) -> None:
+            handled.append(("first", response))
+
+        async def second(response: dict) -> None:
+            handled.append(("second", response))
+
+        waiting = [
+            asyncio.ensure_future(dispatcher.wait_response(TOPIC, ADDRESS, handler, 5)) for handler in (first, second)
+        ]
+        await asyncio.sleep(0)
+        await _run(dispatcher, [f"{{'address': '{ADDRESS}'}}".encode()])
+        await asyncio.gather(*waiting)
+        await dispatcher.stop()
+        return handled
+
+    assert asyncio.run(asyncio.wait_for(scenario(), 5)) == [("first", {"address": ADDRESS})]
+
+
+def test_handler_failure_resolves_all_waiters():
+    async def scenario():
+        dispatcher = _dispatcher()
+
+        async def handler(response: dict) -> None:
+            raise KeyError("success")
+
+        waiting = [asyncio.ensure_future(dispatcher.wait_response(TOPIC, ADDRESS, handler, 5)) for _ in range(2)]
+        await asyncio.sleep(0)
+        await _run(dispatcher, [f"{{'address': '{ADDRESS}'}}".encode()])
+        results = await asyncio.gather(*waiting, return_exceptions=True)
+        await dispatcher.stop()
+        return [type(result) for result in results]
+
+    assert asyncio.run(asyncio.wait_for(scenario(), 5)) == [KeyError, KeyError]
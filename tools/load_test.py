@@ -0,0 +1,642 @@
+"""
+Fleet-scale load test of the agent-facing protocol. Runs many simulated householders in one process against a local
+    in-memory PubSub broker, offsetting agent and IPFS gateway, through the integration's own query, compensation and
+    subscription code, and reports throughput, latency, threads, connections and memory.
+
+Two client designs are compared:
+
+* ``per-call`` - a PubSub connection per published message and a blocking subscription per query, as every
+  integration did before the shared transport;
+* ``shared`` - one ``PubSubTransport`` with long-lived subscriptions, the ``ResponseDispatcher`` and the
+  ``BatchPublisher``.
+
+Requires the integration requirements (robonomics-interface, IPFS-Toolkit) installed, HomeAssistant is not needed.
+    Network access is not needed either, PubSub and IPFS clients are replaced with the local stand-ins.
+
+Example::
+
+    python tools/load_test.py --households 1000 --mode both --operations both --batch-size 20
+
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import queue
+import random
+import resource
+import sys
+import threading
+import types
+import typing as tp
+from ast import literal_eval
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic, sleep
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE = "custom_components.carbon_offsetting_web3"
+
+# Import the protocol modules without the package ``__init__``, which is HomeAssistant glue.
+sys.path.insert(0, ROOT)
+for name, path in (
+    ("custom_components", os.path.join(ROOT, "custom_components")),
+    (PACKAGE, os.path.join(ROOT, "custom_components", "carbon_offsetting_web3")),
+):
+    module = types.ModuleType(name)
+    module.__path__ = [path]
+    sys.modules[name] = module
+
+from custom_components.carbon_offsetting_web3 import const  # noqa: E402
+from custom_components.carbon_offsetting_web3.utils import ipfs, pubsub  # noqa: E402
+from custom_components.carbon_offsetting_web3.utils.batching import BATCH_KEY, BatchPublisher  # noqa: E402
+from custom_components.carbon_offsetting_web3.utils.dispatcher import ResponseDispatcher  # noqa: E402
+from custom_components.carbon_offsetting_web3.utils.offsetting_client import (  # noqa: E402
+    send_last_compensation_date_query,
+    send_offset_query,
+)
+
+_STOP = object()
+
+
+class LocalBroker:
+    """In-memory PubSub broker. Each subscription gets its own queue, drained by the thread blocked in it."""
+
+    def __init__(self, connect_delay: float) -> None:
+        """
+        Class init function, sets all class attributes.
+
+        :param connect_delay: Time a client connection takes, s.
+
+        """
+
+        self.connect_delay = connect_delay
+        self._lock = threading.Lock()
+        self._subscriptions: tp.Dict[str, tp.List[queue.SimpleQueue]] = {}
+        self.connections = 0
+        self.subscriptions = 0
+        self.peak_subscriptions = 0
+        self.published = 0
+        self.delivered = 0
+
+    def connect(self) -> None:
+        """Open a client connection."""
+        sleep(self.connect_delay)
+        with self._lock:
+            self.connections += 1
+
+    def subscribe(self, topic: str) -> queue.SimpleQueue:
+        """
+        Subscribe to a topic.
+
+        :param topic: Topic to subscribe to.
+
+        :return: Queue the topic messages are delivered to.
+
+        """
+
+        messages = queue.SimpleQueue()
+        with self._lock:
+            self._subscriptions.setdefault(topic, []).append(messages)
+            self.subscriptions += 1
+            self.peak_subscriptions = max(self.peak_subscriptions, self.subscriptions)
+        return messages
+
+    def unsubscribe(self, topic: str, messages: queue.SimpleQueue) -> None:
+        """
+        Cancel a subscription.
+
+        :param topic: Topic subscribed to.
+        :param messages: Subscription queue.
+
+        """
+
+        with self._lock:
+            self._subscriptions[topic].remove(messages)
+            self.subscriptions -= 1
+
+    def subscribers(self, topic: str) -> int:
+        """
+        Amount of subscriptions to a topic.
+
+        :param topic: Topic.
+
+        """
+
+        with self._lock:
+            return len(self._subscriptions.get(topic, []))
+
+    def publish(self, topic: str, data: bytes) -> None:
+        """
+        Deliver a message to all the topic subscriptions.
+
+        :param topic: Topic to publish to.
+        :param data: Message.
+
+        """
+
+        with self._lock:
+            targets = list(self._subscriptions.get(topic, []))
+            self.published += 1
+            self.delivered += len(targets)
+        for messages in targets:
+            messages.put(data)
+
+    def close(self) -> None:
+        """Release all the threads blocked in subscriptions."""
+        with self._lock:
+            targets = [messages for subscriptions in self._subscriptions.values() for messages in subscriptions]
+        for messages in targets:
+            messages.put(_STOP)
+
+
+def make_pubsub_class(broker: LocalBroker) -> type:
+    """
+    Get a stand-in for ``robonomicsinterface.PubSub`` bound to the local broker.
+
+    :param broker: Local broker.
+
+    :return: PubSub class.
+
+    """
+
+    class LocalPubSub:
+        """``robonomicsinterface.PubSub`` and ``AbortablePubSub`` API over the local broker."""
+
+        def __init__(self, account) -> None:
+            self._account = account
+            self._subscription: tp.Optional[queue.SimpleQueue] = None
+
+        def connect(self, multiaddr: str) -> bool:
+            """Connect to the broker."""
+            broker.connect()
+            return True
+
+        def publish(self, topic: str, data: str) -> bool:
+            """Publish a message to the broker."""
+            broker.publish(topic, data.encode())
+            return True
+
+        def subscribe(self, topic: str, result_handler: tp.Callable) -> None:
+            """Block delivering topic messages to the handler until it returns non-None."""
+            self.subscribe_until_aborted(topic, result_handler)
+
+        def subscribe_until_aborted(self, topic: str, callback: tp.Callable) -> None:
+            """Block delivering topic messages to the callback until it returns non-None or ``abort`` is called."""
+            self._subscription = broker.subscribe(topic)
+            try:
+                update_nr = 0
+                while True:
+                    data = self._subscription.get()
+                    if data is _STOP:
+                        return
+                    obj = {"params": {"result": {"data": list(data)}}}
+                    if callback(obj, update_nr, 0) is not None:
+                        return
+                    update_nr += 1
+            finally:
+                broker.unsubscribe(topic, self._subscription)
+
+        def abort(self) -> None:
+            """Wake up the thread blocked in the subscription, ending it."""
+            if self._subscription is not None:
+                self._subscription.put(_STOP)
+
+        def close(self) -> None:
+            """Nothing to close, connections to the broker are not kept."""
+
+    return LocalPubSub
+
+
+def make_ipfs_module(ipfs_delay: float) -> types.ModuleType:
+    """
+    Get a stand-in for ``ipfshttpclient2`` returning content hashes as CIDs.
+
+    :param ipfs_delay: Time an upload takes, s.
+
+    :return: Module with a ``connect`` function.
+
+    """
+
+    class LocalIPFSClient:
+        """``ipfshttpclient2`` client API returning content hashes as CIDs."""
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def add_json(self, content: dict) -> str:
+            """Upload content, returning its hash as a CID."""
+            sleep(ipfs_delay)
+            return "Qm" + hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()[:44]
+
+    module = types.ModuleType("ipfshttpclient2")
+    module.connect = lambda addr, auth=None: LocalIPFSClient()
+    return module
+
+
+class LocalSigner:
+    """Liability signer stand-in, signing is not what is measured."""
+
+    def sign_liability(self, technics: str, economics: int) -> str:
+        """Hash the liability parameters as a signature."""
+        return "0x" + hashlib.sha256(f"{technics}{economics}".encode()).hexdigest()
+
+
+class LocalAgent:
+    """Offsetting agent answering kWh queries and liabilities, batches included, after a fixed processing time."""
+
+    def __init__(self, broker: LocalBroker, agent_delay: float) -> None:
+        """
+        Class init function, sets all class attributes.
+
+        :param broker: Local broker.
+        :param agent_delay: Time the agent takes to process a message, s.
+
+        """
+
+        self._broker = broker
+        self._agent_delay = agent_delay
+        self._threads = [
+            threading.Thread(target=self._serve, args=(topic,), daemon=True)
+            for topic in (const.LAST_COMPENSATION_DATE_QUERY_TOPIC, const.LIABILITY_QUERY_TOPIC)
+        ]
+
+    def start(self) -> None:
+        """Subscribe to the query topics."""
+        for thread in self._threads:
+            thread.start()
+        while not all(
+            self._broker.subscribers(topic)
+            for topic in (const.LAST_COMPENSATION_DATE_QUERY_TOPIC, const.LIABILITY_QUERY_TOPIC)
+        ):
+            sleep(0.01)
+
+    def _serve(self, topic: str) -> None:
+        """
+        Answer the messages of a query topic.
+
+        :param topic: Query topic.
+
+        """
+
+        messages = self._broker.subscribe(topic)
+        try:
+            while True:
+                data = messages.get()
+                if data is _STOP:
+                    return
+                sleep(self._agent_delay)
+                query = literal_eval(data.decode())
+                if BATCH_KEY in query:
+                    items = [self._answer(topic, item) for item in query[BATCH_KEY]]
+                    response = {BATCH_KEY: [response for _, response in items]}
+                    response_topic = items[0][0]
+                else:
+                    response_topic, response = self._answer(topic, query)
+                self._broker.publish(response_topic, str(response).encode())
+        finally:
+            self._broker.unsubscribe(topic, messages)
+
+    @staticmethod
+    def _answer(topic: str, query: dict) -> tp.Tuple[str, dict]:
+        """
+        Answer a single query.
+
+        :param topic: Query topic.
+        :param query: Query message.
+
+        :return: Response topic and message.
+
+        """
+
+        if topic == const.LAST_COMPENSATION_DATE_QUERY_TOPIC:
+            return const.LAST_COMPENSATION_DATE_RESPONSE_TOPIC, dict(
+                address=query["address"],
+                kwh_to_compensate=round(query["kwh_current"] * 0.1, 3),
+                last_compensation_date=None,
+            )
+        return const.LIABILITY_REPORT_TOPIC, dict(
+            address=query["promisee"], success=True, total=1.0, report=query["technics"]
+        )
+
+
+class PerCallClient:
+    """Householder client connecting and subscribing on each call, as before the shared transport."""
+
+    def __init__(self, address: str, timeout: float) -> None:
+        """
+        Class init function, sets all class attributes.
+
+        :param address: Householder address.
+        :param timeout: Response timeout, s.
+
+        """
+
+        self._address = address
+        self._timeout = timeout
+
+    async def _request(self, response_topic: str, send: tp.Callable[[], tp.Awaitable]) -> None:
+        """
+        Subscribe to a response topic, send the query and wait for the householder response.
+
+        :param response_topic: Topic the response comes to.
+        :param send: Coroutine function sending the query.
+
+        """
+
+        def callback(obj, update_nr, subscription_id) -> tp.Optional[bool]:
+            """Cancel the subscription once the householder response came."""
+            response = pubsub.parse_income_message(obj["params"]["result"]["data"])
+            if response.get("address") == self._address:
+                return True
+
+        subscription = asyncio.ensure_future(pubsub.subscribe_response_topic(response_topic, callback))
+        try:
+            await asyncio.sleep(1)
+            await send()
+            await asyncio.wait_for(asyncio.shield(subscription), self._timeout)
+        finally:
+            subscription.cancel()
+
+    async def query(self, kwh: float) -> None:
+        """Query the amount of kWh to compensate."""
+        await self._request(
+            const.LAST_COMPENSATION_DATE_RESPONSE_TOPIC,
+            lambda: send_last_compensation_date_query(self._address, kwh),
+        )
+
+    async def compensate(self, kwh: float, ipfs_gateways: list) -> None:
+        """Send a liability and wait for its report."""
+        await self._request(
+            const.LIABILITY_REPORT_TOPIC,
+            lambda: send_offset_query("0.0, 0.0", kwh, ipfs_gateways, self._address, LocalSigner()),
+        )
+
+
+class SharedClient:
+    """Householder client over the shared transport, dispatcher and batching publisher."""
+
+    def __init__(self, address: str, timeout: float, dispatcher: ResponseDispatcher, publisher: BatchPublisher):
+        """
+        Class init function, sets all class attributes.
+
+        :param address: Householder address.
+        :param timeout: Response timeout, s.
+        :param dispatcher: Shared response dispatcher.
+        :param publisher: Shared batching publisher.
+
+        """
+
+        self._address = address
+        self._timeout = timeout
+        self._dispatcher = dispatcher
+        self._publisher = publisher
+
+    async def _request(self, response_topic: str, send: tp.Callable[[], tp.Awaitable]) -> None:
+        """
+        Register the response handler, send the query and wait for the householder response.
+
+        :param response_topic: Topic the response comes to.
+        :param send: Coroutine function sending the query.
+
+        """
+
+        async def handle_response(response: dict) -> None:
+            """Nothing to apply, only the arrival is measured."""
+
+        waiter = asyncio.ensure_future(
+            self._dispatcher.wait_response(response_topic, self._address, handle_response, self._timeout)
+        )
+        await asyncio.sleep(0)
+        try:
+            await send()
+            await waiter
+        finally:
+            waiter.cancel()
+
+    async def query(self, kwh: float) -> None:
+        """Query the amount of kWh to compensate."""
+        await self._request(
+            const.LAST_COMPENSATION_DATE_RESPONSE_TOPIC,
+            lambda: send_last_compensation_date_query(self._address, kwh, publish=self._publisher.send),
+        )
+
+    async def compensate(self, kwh: float, ipfs_gateways: list) -> None:
+        """Send a liability and wait for its report."""
+        await self._request(
+            const.LIABILITY_REPORT_TOPIC,
+            lambda: send_offset_query(
+                "0.0, 0.0", kwh, ipfs_gateways, self._address, LocalSigner(), publish=self._publisher.send
+            ),
+        )
+
+
+def rss_kb() -> int:
+    """
+    Current resident set size of the process.
+
+    :return: RSS, kB.
+
+    """
+
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def percentile(ordered: tp.List[float], p: float) -> tp.Optional[float]:
+    """
+    Nearest-rank percentile.
+
+    :param ordered: Sorted samples.
+    :param p: Percentile, 0-100.
+
+    :return: Percentile or None if no samples.
+
+    """
+
+    if not ordered:
+        return None
+    return ordered[max(math.ceil(p / 100 * len(ordered)), 1) - 1]
+
+
+async def run(args: argparse.Namespace, mode: str) -> tp.Dict[str, tp.Any]:
+    """
+    Run the load test of one client design.
+
+    :param args: Command line arguments.
+    :param mode: ``per-call`` or ``shared``.
+
+    :return: Report.
+
+    """
+
+    loop = asyncio.get_running_loop()
+    if args.executor_workers:
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=args.executor_workers))
+
+    broker = LocalBroker(args.connect_delay)
+    pubsub.PubSub = pubsub.AbortablePubSub = make_pubsub_class(broker)
+    pubsub.Account = lambda *a, **kw: None
+    ipfs.ipfshttpclient2 = make_ipfs_module(args.ipfs_delay)
+    ipfs_gateways = [(f"/ip4/127.0.0.1/tcp/{5001 + i}/http", lambda: ()) for i in range(args.ipfs_gateways)]
+    agent = LocalAgent(broker, args.agent_delay)
+    await loop.run_in_executor(None, agent.start)
+
+    transport = dispatcher = None
+    if mode == "shared":
+        address_filter = pubsub.AddressFilter()
+        dispatcher = ResponseDispatcher(loop, address_filter, args.queue_size, const.OVERFLOW_DROP_FOREIGN_FIRST)
+        dispatcher.start()
+        transport = pubsub.PubSubTransport(
+            loop,
+            [const.LAST_COMPENSATION_DATE_RESPONSE_TOPIC, const.LIABILITY_REPORT_TOPIC],
+            dispatcher.enqueue,
+            agent_multiaddr="local",
+        )
+        transport.start()
+        publisher = BatchPublisher(loop, transport.publish, args.batch_size, args.batch_linger)
+        while not (
+            broker.subscribers(const.LAST_COMPENSATION_DATE_RESPONSE_TOPIC)
+            and broker.subscribers(const.LIABILITY_REPORT_TOPIC)
+        ):
+            await asyncio.sleep(0.01)
+
+    clients = []
+    for i in range(args.households):
+        address = f"4{i:047d}"
+        if mode == "shared":
+            address_filter.add(address)
+            clients.append(SharedClient(address, args.timeout, dispatcher, publisher))
+        else:
+            clients.append(PerCallClient(address, args.timeout))
+
+    latencies: tp.Dict[str, tp.List[float]] = {"query": [], "compensate": []}
+    failures: tp.Dict[str, tp.Dict[str, int]] = {"query": {}, "compensate": {}}
+    peaks = dict(threads=threading.active_count(), rss_kb=rss_kb())
+    rss_before = peaks["rss_kb"]
+
+    async def measure(operation: str, call: tp.Awaitable) -> None:
+        """Time an operation, counting failures by kind."""
+        started = monotonic()
+        # The response timeout only starts once the query is sent, the deadline catches operations stuck before.
+        deadline = asyncio.ensure_future(asyncio.sleep(args.deadline))
+        operation_task = asyncio.ensure_future(call)
+        try:
+            await asyncio.wait({operation_task, deadline}, return_when=asyncio.FIRST_COMPLETED)
+            if not operation_task.done():
+                operation_task.cancel()
+                failures[operation]["deadline"] = failures[operation].get("deadline", 0) + 1
+                return
+            operation_task.result()
+        except Exception as e:
+            kind = "timeout" if isinstance(e, asyncio.TimeoutError) else type(e).__name__
+            failures[operation][kind] = failures[operation].get(kind, 0) + 1
+        else:
+            latencies[operation].append(monotonic() - started)
+        finally:
+            deadline.cancel()
+
+    async def household(client) -> None:
+        """Run the operations of a householder."""
+        await asyncio.sleep(random.uniform(0, args.ramp))
+        for _ in range(args.rounds):
+            kwh = random.uniform(10, 1000)
+            if args.operations in ("query", "both"):
+                await measure("query", client.query(kwh))
+            if args.operations in ("compensate", "both"):
+                await measure("compensate", client.compensate(kwh, ipfs_gateways))
+
+    async def sample() -> None:
+        """Track peak thread count and memory."""
+        while True:
+            peaks["threads"] = max(peaks["threads"], threading.active_count())
+            peaks["rss_kb"] = max(peaks["rss_kb"], rss_kb())
+            await asyncio.sleep(0.05)
+
+    sampler = asyncio.ensure_future(sample())
+    started = monotonic()
+    await asyncio.gather(*(household(client) for client in clients))
+    elapsed = monotonic() - started
+    sampler.cancel()
+
+    report = dict(
+        mode=mode,
+        households=args.households,
+        executor_workers=args.executor_workers or min(32, (os.cpu_count() or 1) + 4),
+        elapsed_s=round(elapsed, 2),
+        peak_threads=peaks["threads"],
+        peak_rss_mb=round(peaks["rss_kb"] / 1024, 1),
+        rss_growth_mb=round((peaks["rss_kb"] - rss_before) / 1024, 1),
+        connections=broker.connections,
+        peak_subscriptions=broker.peak_subscriptions,
+        published=broker.published,
+        delivered=broker.delivered,
+    )
+    for operation, samples in latencies.items():
+        if not samples and not failures[operation]:
+            continue
+        samples.sort()
+        report[operation] = dict(
+            ok=len(samples),
+            failed=failures[operation],
+            throughput_per_s=round(len(samples) / elapsed, 1),
+            p50_s=round(percentile(samples, 50), 3) if samples else None,
+            p99_s=round(percentile(samples, 99), 3) if samples else None,
+            max_s=round(samples[-1], 3) if samples else None,
+        )
+    if dispatcher is not None:
+        report["dispatcher"] = dispatcher.stats
+        await transport.stop()
+        await dispatcher.stop()
+    broker.close()
+    return report
+
+
+def main() -> None:
+    """Parse arguments, run the load test and print reports."""
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n\n")[0], formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("--households", type=int, default=500, help="Simulated householders.")
+    parser.add_argument("--mode", choices=["per-call", "shared", "both"], default="both", help="Client design.")
+    parser.add_argument("--operations", choices=["query", "compensate", "both"], default="query")
+    parser.add_argument("--rounds", type=int, default=1, help="Operations per householder.")
+    parser.add_argument("--ramp", type=float, default=5.0, help="Householders start spread over this time, s.")
+    parser.add_argument("--timeout", type=float, default=const.DEFAULT_QUERY_TIMEOUT, help="Response timeout, s.")
+    parser.add_argument("--deadline", type=float, default=60.0, help="Time to give up on a stuck operation, s.")
+    parser.add_argument("--batch-size", type=int, default=const.DEFAULT_BATCH_SIZE, help="Shared mode batch size.")
+    parser.add_argument("--batch-linger", type=float, default=const.DEFAULT_BATCH_LINGER)
+    parser.add_argument("--queue-size", type=int, default=const.DEFAULT_QUEUE_SIZE, help="Shared mode queue size.")
+    parser.add_argument("--connect-delay", type=float, default=0.05, help="PubSub connection time, s.")
+    parser.add_argument("--agent-delay", type=float, default=0.001, help="Agent time per message, s.")
+    parser.add_argument("--ipfs-delay", type=float, default=0.05, help="IPFS upload time, s.")
+    parser.add_argument("--ipfs-gateways", type=int, default=1)
+    parser.add_argument("--executor-workers", type=int, default=0, help="Default executor size, 0 for asyncio's.")
+    parser.add_argument("--json", action="store_true", help="Print reports as JSON.")
+    args = parser.parse_args()
+
+    reports = [
+        asyncio.run(run(args, mode)) for mode in (["per-call", "shared"] if args.mode == "both" else [args.mode])
+    ]
+    if args.json:
+        print(json.dumps(reports, indent=2))
+        return
+    for report in reports:
+        print(f"== {report.pop('mode')} ==")
+        for key, value in report.items():
+            print(f"  {key}: {value}")
+
+
+if __name__ == "__main__":
+    main()